@@ -1,4 +1,27 @@
+from redlock_sdk import rate_limit
+from redlock_sdk import cache
+from redlock_sdk import metrics
 from redlock_sdk import redlock_api
+from redlock_sdk import stream
+from redlock_sdk import alerts
+from redlock_sdk import identity
+from redlock_sdk import records
+from redlock_sdk import planner
+from redlock_sdk import lazy
+from redlock_sdk import inventory
+from redlock_sdk import alert_store
 from redlock_sdk import standard
 from redlock_sdk import account
 from redlock_sdk import report
+
+
+# Modules with optional dependencies (numpy, pyarrow, aiohttp) aren't imported with the package.
+# redlock_sdk.aggregate etc. still work, they load on first use.
+__lazy_modules__ = ("aggregate", "export", "async_api")
+
+
+def __getattr__(name):
+    if name in __lazy_modules__:
+        from importlib import import_module
+        return(import_module(f"redlock_sdk.{name}"))
+    raise AttributeError(f"module 'redlock_sdk' has no attribute {name!r}")
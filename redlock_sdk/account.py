@@ -9,6 +9,7 @@ import getpass
 import datetime
 from dateutil import tz
 import copy
+import functools
 
 import logging
 logger = logging.getLogger()
@@ -21,35 +22,93 @@ except ImportError as e:
     exit(1)
 
 
-class RedLockCloudAccount(object):
+class RedLockCloudAccount(lazy.RedLockLazyMixin, identity.RedLockIdentityMixin):
     """
     Abstraction class for a Cloud Account in RedLock
+
+    Children take lazy=True to skip the fetch until an attribute other than account_id is needed.
     """
 
     def __str__(self):
         """when converted to a string, become the account_id"""
-        if not hasattr(self, "name"):
+        if "name" not in self.__dict__:
+            # Also keeps lazy accounts from loading just to be printed
             return(f"UnNamed ({self.account_id})")
         return(f"{self.name} ({self.account_id})")
 
     def __init__(self):
         raise NotImplementedError # Implemented by children
 
+    @classmethod
+    def from_data(cls, api, cloudData, account_id=None, detailed=True, debug=False):
+        '''Build an account from data already fetched, without calling the API.
+        cloudData is a cloud/{type}/{id} body (detailed) or an entry of the cloud listing (detailed=False),
+        which lacks some fields such as roleArn/externalId. get() fills those in.
+        Returns the existing object if this account is already in the api's identity map.'''
+        account_id = account_id or cloudData['accountId']
+        account = cls.__identity__(api, account_id)
+        if account is not None:
+            # Never swap detail that is already there for partial listing data
+            if detailed or not account.__dict__.get("detailed", False):
+                account.__hydrate__(cloudData, detailed)
+            return(account)
+
+        account = cls.__new__(cls)
+        account.api = api
+        account.debug = debug
+        account.account_id = account_id
+        account.cloud_type = cls.cloud_type
+        account.__hydrate__(cloudData, detailed)
+        return(cls.__register__(api, account_id, account))
+
+    @classmethod
+    def from_inventory(cls, inventory, account_id):
+        '''Build an account from a local inventory.RedLockInventory instead of the network.
+        The inventory holds the cloud listing, so fields it lacks are fetched on first use.
+        The class comes from the entry's cloudType: RedLockCloudAccount.from_inventory() builds
+        any cloud, a cloud's own class raises ValueError for another cloud's account'''
+        cloudData = inventory.get("account", account_id)
+        if cloudData is None:
+            raise Exception(f"Account {account_id} is not in the inventory")
+        account_class = cloud_account_classes.get(cloudData.get('cloudType'))
+        if account_class is None:
+            raise Exception(f"Account {account_id} has an unsupported cloud type {cloudData.get('cloudType')}")
+        if not issubclass(account_class, cls):
+            raise ValueError(f"Account {account_id} is a {cloudData['cloudType']} account, not a {cls.__name__}")
+        return(account_class.from_data(inventory.api, cloudData, account_id=account_id, detailed=False))
+
+    def __hydrate__(self, cloudData, detailed=True):
+        self.cloudData = cloudData
+        self.__dict__.update(self.cloudData)
+        self.detailed = detailed
+        # Listing data is partial: asking for a field it lacks fetches the detail once
+        self._loaded = detailed
+
+    @classmethod
+    def __prefetch__(cls, api, accounts, max_workers=None):
+        '''Fill many lazy accounts from one cloud listing. See lazy.prefetch()'''
+        refs = [(a.cloud_type, a.account_id) for a in accounts]
+        for a, (cloudData, detailed) in zip(accounts, fetch_account_data(api, refs, max_workers=max_workers)):
+            a.__hydrate__(cloudData, detailed)
+
+    def as_record(self):
+        '''This account's data as a compact records.RedLockAccountRecord'''
+        return(records.RedLockAccountRecord.from_json(self.cloudData))
+
     def delete(self):
         raise NotImplementedError
 
     def get(self):
         '''Get the data from the API for this account'''
-        self.cloudData = self.api.get(f"cloud/{self.cloud_type}/{self.account_id}").json()
-        self.__dict__.update(self.cloudData)
+        self.__hydrate__(self.api.get_json(f"cloud/{self.cloud_type}/{self.account_id}"))
 
     def update(self):
         '''Update this Account.  '''
         response = self.api.put(f"cloud/{self.cloud_type}/{self.uuid}", data=self.cloudData)
         return(response.text)
 
-    def get_alerts(self, policy_type=None, status="open"):
-        '''return all alerts for all time, filtered for this account'''
+    def alert_querystring(self, policy_type=None, status="open"):
+        '''v2/alert filters for all alerts for all time on this account'''
         querystring = {
                     "timeType": "to_now",
                     "timeUnit": "epoch",
@@ -62,14 +121,36 @@ class RedLockCloudAccount(object):
 
         if policy_type is not None:
             querystring['policy.type'] = policy_type
+        return(querystring)
 
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+    def get_alerts(self, policy_type=None, status="open"):
+        '''return all alerts for all time, filtered for this account'''
+        querystring = self.alert_querystring(policy_type, status)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
+
+    def iter_alerts(self, policy_type=None, status="open"):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type, status)))
 
     def dismiss_alert(self, alert_id, dismissal_message):
         '''Validate alert_id applies to this account, and dismiss it'''
-        raise NotImplementedError
+        outcome = self.dismiss_alerts([alert_id], dismissal_message)[str(alert_id)]
+        if outcome == "out_of_scope":
+            raise ValueError(f"Alert {alert_id} is not an alert of {self.account_id}")
+        if isinstance(outcome, Exception):
+            raise outcome
+        return(outcome)
+
+    def dismiss_alerts(self, alert_ids_or_filters, dismissal_message, validate=True, max_workers=None):
+        '''Dismiss many alerts in chunked requests. validate=True skips the ones that aren't this account's
+        (checked with one query). Returns {alert_id: outcome}, see alerts.RedLockAlertBulkAction'''
+        return(alerts.dismiss_alerts(self.api, alert_ids_or_filters, dismissal_message,
+                                     scope=self if validate else None, max_workers=max_workers))
+
+    def reopen_alerts(self, alert_ids_or_filters, validate=True, max_workers=None):
+        '''Reopen many dismissed alerts in chunked requests. See dismiss_alerts()'''
+        return(alerts.reopen_alerts(self.api, alert_ids_or_filters, scope=self if validate else None, max_workers=max_workers))
 
 
 class RedLockAWSAccount(RedLockCloudAccount):
@@ -77,13 +158,20 @@ class RedLockAWSAccount(RedLockCloudAccount):
     Abstraction class for a AWS Account
     self.cloudData is defined here: https://api.docs.redlock.io/reference#add-aws-account
     """
-    def __init__(self, api, account_id, debug=False):
+    cloud_type = "aws"
+    identity_type = "cloud/aws"
+    identity_arg = "account_id"
+
+    def __init__(self, api, account_id, debug=False, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
         self.account_id = account_id
         self.cloud_type = "aws"
-        self.get()
+        if lazy:
+            self._loaded = False
+        else:
+            self.get()
 
     def __repr__(self):
         """Create a useful string for this class if referenced"""
@@ -93,13 +181,20 @@ class RedLockAzureAccount(RedLockCloudAccount):
     """
     Abstraction class for an Azure Account
     """
-    def __init__(self, api, subscription_id, debug=False):
+    cloud_type = "azure"
+    identity_type = "cloud/azure"
+    identity_arg = "subscription_id"
+
+    def __init__(self, api, subscription_id, debug=False, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
         self.account_id = subscription_id
         self.cloud_type = "azure"
-        self.get()
+        if lazy:
+            self._loaded = False
+        else:
+            self.get()
 
     def __repr__(self):
         """Create a useful string for this class if referenced"""
@@ -109,21 +204,57 @@ class RedLockGCPAccount(RedLockCloudAccount):
     """
     Abstraction class for an GCP Project / Organizational parent
     """
-    def __init__(self, api, project_id, debug=False):
+    cloud_type = "gcp"
+    identity_type = "cloud/gcp"
+    identity_arg = "project_id"
+
+    def __init__(self, api, project_id, debug=False, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
         self.account_id = project_id
         self.cloud_type = "gcp"
-        self.get()
+        if lazy:
+            self._loaded = False
+        else:
+            self.get()
 
     def get_subaccounts(self):
         '''Get the data from the API for this account'''
-        results = self.api.get(f"cloud/{self.cloud_type}/{self.account_id}/project").json()
+        # One download of the project list builds every sub account
+        self.project_index = {}
         self.sub_accounts = {}
+        self.refresh_subaccounts()
+        return(self.sub_accounts)
+
+    def refresh_subaccounts(self):
+        '''Re-download the project list and only rebuild the sub accounts whose data changed.
+        project_index maps accountId -> that project's entry of the list.
+        Returns a dict of the accountIds that were added, changed and removed.'''
+        if "project_index" not in self.__dict__:
+            self.project_index = {}
+            self.sub_accounts = {}
+
+        results = self.api.get_json(f"cloud/{self.cloud_type}/{self.account_id}/project")
+        changes = {"added": [], "changed": [], "removed": []}
+        latest = {}
         for s in results:
-            # print(s)
-            self.sub_accounts[s['accountId']] = RedLockGCPSubAccount(self.api, s['accountId'], self.account_id)
+            latest[s['accountId']] = s
+            previous = self.project_index.get(s['accountId'])
+            if previous is None:
+                changes['added'].append(s['accountId'])
+                self.sub_accounts[s['accountId']] = RedLockGCPSubAccount.from_data(self.api, s, self.account_id, parent=self, debug=self.debug)
+            elif previous != s:
+                changes['changed'].append(s['accountId'])
+                self.sub_accounts[s['accountId']].__hydrate__(s)
+
+        for account_id in self.project_index:
+            if account_id not in latest:
+                changes['removed'].append(account_id)
+                del self.sub_accounts[account_id]
+
+        self.project_index = latest
+        return(changes)
 
     def __repr__(self):
         """Create a useful string for this class if referenced"""
@@ -133,27 +264,82 @@ class RedLockGCPAccount(RedLockCloudAccount):
 class RedLockGCPSubAccount(RedLockCloudAccount):
     """
     Abstraction class for an GCP Project / Organizational parent
+
+    Pass parent (the RedLockGCPAccount) to look the project up in the parent's project_index
+    rather than downloading the organization's whole project list again.
     """
-    def __init__(self, api, project_id, parent_id, debug=False):
+    cloud_type = "gcp"
+    identity_type = "cloud/gcp/project"
+    identity_arg = "project_id"
+    identity_attachments = ("parent",)
+
+    def __init__(self, api, project_id, parent_id, debug=False, parent=None, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
         self.account_id = project_id
         self.parent_id = parent_id
+        self.parent = parent
         self.cloud_type = "gcp"
-        self.get()
+        if parent is not None and project_id in parent.__dict__.get("project_index", {}):
+            self.__hydrate__(parent.project_index[project_id])
+        elif lazy:
+            self._loaded = False
+        else:
+            self.get()
+
+    @classmethod
+    def from_data(cls, api, cloudData, parent_id, parent=None, debug=False):
+        '''Build a sub account from its entry of cloud/gcp/{org}/project, without calling the API'''
+        account = cls.__identity__(api, cloudData['accountId'])
+        if account is not None:
+            if parent is not None:
+                account.parent = parent
+            account.__hydrate__(cloudData)
+            return(account)
+
+        account = cls.__new__(cls)
+        account.api = api
+        account.debug = debug
+        account.account_id = cloudData['accountId']
+        account.parent_id = parent_id
+        account.parent = parent
+        account.cloud_type = cls.cloud_type
+        account.__hydrate__(cloudData)
+        return(cls.__register__(api, account.account_id, account))
+
+    def __hydrate__(self, cloudData, detailed=True):
+        self.cloudData = cloudData
+        self.__dict__.update(self.cloudData)
+        self.detailed = True
+        self._loaded = True
+
+    @classmethod
+    def __prefetch__(cls, api, accounts, max_workers=None):
+        '''Fill many lazy sub accounts with one project list download per organization'''
+        by_parent = {}
+        for a in accounts:
+            by_parent.setdefault(a.parent_id, []).append(a)
+        for parent_id, subs in by_parent.items():
+            index = {s['accountId']: s for s in api.get_json(f"cloud/gcp/{parent_id}/project")}
+            for a in subs:
+                if a.account_id not in index:
+                    raise Exception(f"projectId {a.account_id} was not found for organization {parent_id}")
+                a.__hydrate__(index[a.account_id])
 
     # need to override this for a subaccount
     def get(self):
         '''Get the data from the API for this account'''
-        results = self.api.get(f"cloud/{self.cloud_type}/{self.parent_id}/project").json()
-        for s in results:
-            if s['accountId'] == self.account_id:
-                self.cloudData = s
-                # print(s)
-                self.__dict__.update(self.cloudData)
-                return()
-        raise Exception(f"projectId {self.account_id} was not found for organization {self.parent_id}")
+        if self.parent is not None:
+            # Refreshing through the parent keeps its index (and its other sub accounts) current
+            self.parent.refresh_subaccounts()
+            index = self.parent.project_index
+        else:
+            results = self.api.get_json(f"cloud/{self.cloud_type}/{self.parent_id}/project")
+            index = {s['accountId']: s for s in results}
+        if self.account_id not in index:
+            raise Exception(f"projectId {self.account_id} was not found for organization {self.parent_id}")
+        self.__hydrate__(index[self.account_id])
 
     def update(self):
         raise NotImplementedError # Sub Accounts can't be updated
@@ -166,14 +352,35 @@ class RedLockGCPSubAccount(RedLockCloudAccount):
         return(f"<RedLockGCPSubAccount [{self.account_id}] {self.name} >")
 
 
-class RedLockAccountGroup(object):
+class RedLockAccountGroup(lazy.RedLockLazyMixin, identity.RedLockIdentityMixin):
     """
     Abstraction class for a Cloud AccountGroup in RedLock
+
+    With a registry (RedLockAccountGroupRegistry) the name lookup and get() are served from
+    the registry's single cloud/group listing instead of downloading it again.
+    With lazy=True nothing is fetched (not even the id) until an attribute is needed.
+    Groups are keyed by name in the api's identity map.
     """
-    def __init__(self, api, group_name, group_id=None, debug=False):
+
+    identity_type = "cloud/group"
+    identity_arg = "group_name"
+    identity_attachments = ("registry",)
+
+    # The RedLockAccountGroupBatch collecting add_account()/remove_account() calls, if any
+    pending_batch = None
+
+    def __init__(self, api, group_name, group_id=None, debug=False, registry=None, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
+        self.registry = registry
+
+        if lazy:
+            self.name = group_name
+            if group_id is not None:
+                self.group_id = group_id
+            self._loaded = False
+            return
 
         if group_id is None:
             # We don't know the id, must find it
@@ -183,8 +390,65 @@ class RedLockAccountGroup(object):
                 raise RedLockAccountGroupNotFoundError(group_name)
 
         self.group_id = group_id
+        if registry is not None and group_id in registry.groupData:
+            self.__hydrate__(registry.groupData[group_id])
+        else:
+            self.get()
+
+    @classmethod
+    def from_data(cls, api, groupData, debug=False, registry=None):
+        '''Build a group from an entry of the cloud/group listing, without calling the API'''
+        group = cls.__identity__(api, groupData['name'])
+        if group is not None:
+            if group.registry is None:
+                group.registry = registry
+            group.__hydrate__(groupData)
+            return(group)
+
+        group = cls.__new__(cls)
+        group.api = api
+        group.debug = debug
+        group.registry = registry
+        group.group_id = groupData['id']
+        group.__hydrate__(groupData)
+        return(cls.__register__(api, groupData['name'], group))
+
+    @classmethod
+    def from_inventory(cls, inventory, group_name_or_id):
+        '''Build a group from a local inventory.RedLockInventory instead of the network'''
+        groupData = inventory.lookup("group", group_name_or_id)
+        if groupData is None:
+            raise RedLockAccountGroupNotFoundError(group_name_or_id)
+        return(cls.from_data(inventory.api, groupData))
+
+    def __hydrate__(self, groupData):
+        self.groupData = groupData
+        self.__dict__.update(self.groupData)
+        self.group_id = groupData['id']
+
+    def __load__(self):
+        if "group_id" not in self.__dict__:
+            group_id = self.__find_id__(self.name)
+            if group_id is None:
+                raise RedLockAccountGroupNotFoundError(self.name)
+            self.group_id = group_id
         self.get()
 
+    @classmethod
+    def __prefetch__(cls, api, groups, max_workers=None):
+        '''Fill many lazy groups from one cloud/group listing. See lazy.prefetch()'''
+        listing = api.get_json("cloud/group")
+        by_id = {g['id']: g for g in listing}
+        by_name = {g['name']: g for g in listing}
+        for group in groups:
+            if "group_id" in group.__dict__:
+                data = by_id.get(group.group_id)
+            else:
+                data = by_name.get(group.name)
+            if data is None:
+                raise RedLockAccountGroupNotFoundError(group.name)
+            group.__hydrate__(data)
+
     @classmethod
     def create(cls, rl_api, group_name, description):
         '''Classmethod to create a new account group'''
@@ -201,15 +465,14 @@ class RedLockAccountGroup(object):
     @classmethod
     def all(cls, rl_api):
         '''Classmethod to return an hash of all RedLockAccountGroup indexed by name'''
-        output = {}
-        account_groups = rl_api.get("cloud/group").json()
-        for g in account_groups:
-            output[g['name']] = RedLockAccountGroup(rl_api, g['name'], group_id=g['id'])
-        return(output)
+        registry = RedLockAccountGroupRegistry(rl_api)
+        return(dict(registry.by_name))
 
     def __find_id__(self, group_name):
         '''Given the name (primary key) get the id (which is neede by the API)'''
-        groups = self.api.get(f"cloud/group/name").json()
+        if self.registry is not None:
+            return(self.registry.find_id(group_name))
+        groups = self.api.get_json(f"cloud/group/name")
         for g in groups:
             if g['name'] == group_name:
                 return(g['id'])
@@ -236,8 +499,16 @@ class RedLockAccountGroup(object):
         # This call doesn't return the same data that the /cloud/group returns.
         # self.groupData = self.api.get(f"cloud/group/{self.group_id}").json()
 
+        if self.registry is not None:
+            # One listing refreshes every group in the registry, this one included
+            self.registry.refresh()
+            if self.group_id not in self.registry.groupData:
+                raise RedLockAccountGroupNotFoundError(self.group_id)
+            self.__hydrate__(self.registry.groupData[self.group_id])
+            return
+
         # Pull everything and find the one block I need
-        all_groups = self.api.get(f"cloud/group/").json()
+        all_groups = self.api.get_json(f"cloud/group/")
         for g in all_groups:
             if g['id'] == self.group_id:
                 self.groupData = g
@@ -257,8 +528,8 @@ class RedLockAccountGroup(object):
         response = self.api.put(f"cloud/group/{self.group_id}", data=payload)
         return(response.text)
 
-    def get_alerts(self, policy_type=None, status="open"):
-        '''return alerts for the Account Group. You can filter by policy_type and status'''
+    def alert_querystring(self, policy_type=None, status="open"):
+        '''v2/alert filters for alerts on the Account Group'''
         querystring = {
                     "timeType": "to_now",
                     "timeUnit": "epoch",
@@ -269,10 +540,27 @@ class RedLockAccountGroup(object):
 
         if policy_type is not None:
             querystring['policy.type'] = policy_type
+        return(querystring)
+
+    def get_alerts(self, policy_type=None, status="open"):
+        '''return alerts for the Account Group. You can filter by policy_type and status'''
+        querystring = self.alert_querystring(policy_type, status)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
 
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+    def iter_alerts(self, policy_type=None, status="open"):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type, status)))
+
+    def dismiss_alerts(self, alert_ids_or_filters, dismissal_message, validate=True, max_workers=None):
+        '''Dismiss many alerts in chunked requests. validate=True skips the ones that aren't alerts of
+        the group's accounts (checked with one query). Returns {alert_id: outcome}, see alerts.RedLockAlertBulkAction'''
+        return(alerts.dismiss_alerts(self.api, alert_ids_or_filters, dismissal_message,
+                                     scope=self if validate else None, max_workers=max_workers))
+
+    def reopen_alerts(self, alert_ids_or_filters, validate=True, max_workers=None):
+        '''Reopen many dismissed alerts in chunked requests. See dismiss_alerts()'''
+        return(alerts.reopen_alerts(self.api, alert_ids_or_filters, scope=self if validate else None, max_workers=max_workers))
 
     def get_account_ids_by_cloud_type(self, cloud_type):
         output = []
@@ -282,27 +570,280 @@ class RedLockAccountGroup(object):
         return(output)
 
     def add_account(self, cloud_account):
-        '''add an account to this account group'''
-        self.accountIds.append(cloud_account.account_id)
-        self.update() and self.get()
+        '''add an account to this account group. Inside batch() this is only recorded'''
+        if self.pending_batch is not None:
+            return(self.pending_batch.add(cloud_account))
+        return(self.sync_members(self.accountIds + [cloud_account.account_id]))
 
     def remove_account(self, cloud_account):
-        '''remove an account from this account group'''
-        self.accountIds.remove(cloud_account.account_id)
-        self.update() and self.get()
-
-    def get_accounts(self, cloud_type=None):
-        '''Return array of CloudAccount objects'''
-        output=[]
+        '''remove an account from this account group. Inside batch() this is only recorded'''
+        if self.pending_batch is not None:
+            return(self.pending_batch.remove(cloud_account))
+        if cloud_account.account_id not in self.accountIds:
+            raise ValueError(f"{cloud_account.account_id} is not a member of {self.name}")
+        return(self.sync_members([a for a in self.accountIds if a != cloud_account.account_id]))
+
+    def diff_members(self, desired_account_ids):
+        '''What sync_members(desired_account_ids) would change, without sending anything.
+        Returns {"group": name, "added": [...], "removed": [...]}'''
+        desired = member_ids(desired_account_ids)
+        current = set(self.accountIds)
+        wanted = set(desired)
+        return({
+            "group": self.name,
+            "added": [a for a in desired if a not in current],
+            "removed": [a for a in self.accountIds if a not in wanted],
+        })
+
+    def sync_members(self, desired_account_ids, refresh=True):
+        '''Make the members of this group exactly desired_account_ids (ids or account objects).
+        The diff is computed locally: one PUT if anything changed, nothing otherwise.
+        refresh=True re-reads the group afterwards (one listing) so accounts is current too.
+        Returns the diff_members() summary'''
+        desired = member_ids(desired_account_ids) # read once, it may be a generator
+        changes = self.diff_members(desired)
+        if changes['added'] or changes['removed']:
+            self.__put_members__(desired)
+            if refresh:
+                self.get()
+        return(changes)
+
+    def __put_members__(self, account_ids):
+        '''PUT the group with account_ids as its members'''
+        previous = self.accountIds
+        self.accountIds = account_ids
+        try:
+            return(self.update())
+        except Exception:
+            self.accountIds = previous
+            raise
+
+    def batch(self, refresh=True):
+        '''Context manager that collects add_account()/remove_account() calls and sends them
+        as one sync_members() when the block exits (nothing is sent if it raises).
+
+            with group.batch() as batch:
+                for a in accounts:
+                    group.add_account(a)
+            print(batch.changes)
+        '''
+        return(RedLockAccountGroupBatch(self, refresh=refresh))
+
+    def get_accounts(self, cloud_type=None, detail_fields=None):
+        '''Return array of CloudAccount objects, built in bulk from one cloud listing. See load_accounts()'''
+        members = []
         for a in self.accounts:
+            if a['type'] in cloud_account_classes and (cloud_type is None or cloud_type == a['type']):
+                members.append(a)
+        return(load_accounts(self.api, members, detail_fields=detail_fields))
+
+    def account_alerts(self, policy_type=None, status="open", cloud_type=None, max_workers=None):
+        '''Alerts of every member account, one v2/alert query per account run concurrently.
+        Returns an alerts.RedLockAlertFanOut: iterate it for (account, alert) pairs as they arrive,
+        then check its errors for the accounts whose query failed.
+        The accounts are lazy, building them costs no requests.'''
+        queries = {}
+        for a in self.accounts:
+            if a['type'] in cloud_account_classes and (cloud_type is None or cloud_type == a['type']):
+                cloud_account = cloud_account_classes[a['type']](self.api, a['id'], debug=self.debug, lazy=True)
+                queries[cloud_account] = cloud_account.alert_querystring(policy_type, status)
+        return(alerts.RedLockAlertFanOut(self.api, queries, max_workers=max_workers))
 
-            if a['type'] == "gcp" and (cloud_type is None or cloud_type == "gcp"):
-                output.append(RedLockGCPAccount(self.api, a['id']))
-            elif a['type'] == "aws" and (cloud_type is None or cloud_type == "aws"):
-                output.append(RedLockAWSAccount(self.api, a['id']))
-            elif a['type'] == "azure" and (cloud_type is None or cloud_type == "azure"):
-                output.append(RedLockAzureAccount(self.api, a['id']))
-        return(output)
+
+
+class RedLockAccountGroupRegistry(object):
+    """
+    Every account group, hydrated from one cloud/group listing and indexed by id and by name.
+    refresh() re-syncs all of them (updating the existing objects in place) with one more request.
+    """
+
+    def __init__(self, api, debug=False):
+        self.api = api
+        self.debug = debug
+        self.groupData = {} # id -> raw listing entry
+        self.by_id = {} # id -> RedLockAccountGroup
+        self.by_name = {} # name -> RedLockAccountGroup
+        self.refresh()
+
+    def __repr__(self):
+        return(f"<RedLockAccountGroupRegistry {len(self.by_id)} groups>")
+
+    def __len__(self):
+        return(len(self.by_id))
+
+    def __iter__(self):
+        return(iter(list(self.by_id.values())))
+
+    def __contains__(self, name_or_id):
+        return(name_or_id in self.by_name or name_or_id in self.by_id)
+
+    def __getitem__(self, name_or_id):
+        if name_or_id in self.by_name:
+            return(self.by_name[name_or_id])
+        if name_or_id in self.by_id:
+            return(self.by_id[name_or_id])
+        raise RedLockAccountGroupNotFoundError(name_or_id)
+
+    def find_id(self, group_name):
+        '''Given the name get the id, or None'''
+        group = self.by_name.get(group_name)
+        return(group.group_id if group is not None else None)
+
+    def refresh(self):
+        '''Re-download cloud/group and re-sync every group. Existing objects are updated in place,
+        new groups are added and deleted ones dropped.'''
+        listing = self.api.get_json("cloud/group")
+        self.groupData = {g['id']: g for g in listing}
+
+        by_id = {}
+        for group_id, data in self.groupData.items():
+            group = self.by_id.get(group_id)
+            if group is None:
+                group = RedLockAccountGroup.from_data(self.api, data, debug=self.debug, registry=self)
+            else:
+                group.__hydrate__(data)
+            by_id[group_id] = group
+        self.by_id = by_id
+        self.by_name = {g.name: g for g in by_id.values()}
+
+
+class RedLockAccountGroupBatch(object):
+    """
+    Membership edits for one account group, sent as a single PUT on exit. See RedLockAccountGroup.batch().
+    changes holds the sync_members() summary once the block is done.
+    """
+
+    def __init__(self, group, refresh=True):
+        self.group = group
+        self.refresh = refresh
+        self.desired = None
+        self.changes = None
+
+    def __enter__(self):
+        if self.group.pending_batch is not None:
+            raise RuntimeError(f"Account group {self.group.name} already has a batch open")
+        self.desired = list(self.group.accountIds)
+        self.group.pending_batch = self
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.group.pending_batch = None
+        if exc_type is None:
+            self.changes = self.group.sync_members(self.desired, refresh=self.refresh)
+        return(False)
+
+    def add(self, cloud_account):
+        '''Record an account (object or id) to add'''
+        account_id = member_ids([cloud_account])[0]
+        if account_id not in self.desired:
+            self.desired.append(account_id)
+
+    def remove(self, cloud_account):
+        '''Record an account (object or id) to remove'''
+        account_id = member_ids([cloud_account])[0]
+        if account_id in self.desired:
+            self.desired.remove(account_id)
+
+
+class RedLockAccountGroupNotFoundError(Exception):
+    '''raised when an account group isn't found'''
+
+
+# cloudType -> class for the top level accounts
+cloud_account_classes = {
+    "aws": RedLockAWSAccount,
+    "azure": RedLockAzureAccount,
+    "gcp": RedLockGCPAccount,
+}
+
+
+def fetch_account_data(api, refs, detail_fields=None, max_workers=None):
+    '''The data behind load_accounts(): for each (cloud_type, account_id) in refs returns
+    (cloudData, detailed), using one cloud listing plus concurrent detail fetches where needed.'''
+    listing = {}
+    for entry in api.get_json("cloud"):
+        listing[(entry.get('cloudType'), entry.get('accountId'))] = entry
+
+    output = [None] * len(refs)
+    need_detail = []
+    for i, ref in enumerate(refs):
+        entry = listing.get(ref)
+        if entry is None or detail_fields is True or any(f not in entry for f in detail_fields or []):
+            need_detail.append(i)
+        else:
+            output[i] = (entry, False)
+
+    if need_detail:
+        responses = api.map_get([f"cloud/{refs[i][0]}/{refs[i][1]}" for i in need_detail], max_workers=max_workers)
+        for i, response in zip(need_detail, responses):
+            if isinstance(response, Exception):
+                raise response
+            cloudData = dict(listing.get(refs[i], {}))
+            cloudData.update(api.codec.loads(response.content))
+            output[i] = (cloudData, True)
+    return(output)
+
+
+def member_ids(accounts):
+    '''Account ids from a mix of ids and account objects, de-duplicated, in order'''
+    output = []
+    for a in accounts:
+        output.append(a.account_id if isinstance(a, RedLockCloudAccount) else a)
+    return(list(dict.fromkeys(output)))
+
+
+def reconcile_groups(api, desired, registry=None, max_workers=None):
+    '''Bring many account groups to a desired state at once.
+
+    desired maps a group name (or id) to the account ids (or account objects) it should hold.
+    Uses one cloud/group listing to diff every group locally, one PUT per group that changed
+    (run concurrently), and one more listing to refresh them. Pass a RedLockAccountGroupRegistry
+    to reuse its listing.
+    Returns {group name: diff_members() summary}. A group whose PUT failed has the exception
+    under "error" and keeps its old membership.'''
+    if registry is None:
+        registry = RedLockAccountGroupRegistry(api)
+
+    summary = {}
+    changed = []
+    for name_or_id, account_ids in desired.items():
+        group = registry[name_or_id]
+        account_ids = member_ids(account_ids) # read once, it may be a generator
+        changes = group.diff_members(account_ids)
+        summary[group.name] = changes
+        if changes['added'] or changes['removed']:
+            changed.append((group, account_ids))
+
+    if changed:
+        calls = [functools.partial(group.__put_members__, account_ids) for group, account_ids in changed]
+        for (group, account_ids), result in zip(changed, api.map_call(calls, max_workers=max_workers)):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to update account group {group.name}: {result}")
+                summary[group.name]['error'] = result
+        registry.refresh()
+    return(summary)
+
+
+def load_accounts(api, accounts, detail_fields=None, max_workers=None):
+    '''Build many cloud account objects from a single GET of the cloud listing, instead of one
+    cloud/{type}/{id} request per account.
+
+    accounts are {"type": ..., "id": ...} dicts (as in RedLockAccountGroup.accounts) or (cloud_type, account_id) tuples.
+    detail_fields lists the fields the caller needs: only accounts whose listing entry lacks one of them
+    (or that are not in the listing at all) get a detail fetch, and those run concurrently.
+    detail_fields=True fetches detail for every account. Returns the accounts in input order.'''
+    refs = []
+    for a in accounts:
+        if isinstance(a, dict):
+            refs.append((a['type'], a['id']))
+        else:
+            refs.append(tuple(a))
+
+    output = []
+    data = fetch_account_data(api, refs, detail_fields=detail_fields, max_workers=max_workers)
+    for (cloud_type, account_id), (cloudData, detailed) in zip(refs, data):
+        output.append(cloud_account_classes[cloud_type].from_data(api, cloudData, account_id=account_id, detailed=detailed))
+    return(output)
 
 
 
@@ -0,0 +1,259 @@
+import itertools
+import collections
+
+import logging
+logger = logging.getLogger()
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from redlock_sdk import alerts
+from redlock_sdk.records import RedLockAlertRecord
+
+
+# Dimensions return a list of values per alert: an alert counts once for each of its compliance sections
+
+def alert_account(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.accountId])
+    return([(alert.get('resource') or {}).get('accountId')])
+
+
+def alert_account_name(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.accountName])
+    return([(alert.get('resource') or {}).get('account')])
+
+
+def alert_cloud_type(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.cloudType])
+    return([(alert.get('resource') or {}).get('cloudType')])
+
+
+def alert_policy(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.policyId])
+    return([alert.get('policyId') or (alert.get('policy') or {}).get('policyId')])
+
+
+def alert_severity(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.severity])
+    return([(alert.get('policy') or {}).get('severity')])
+
+
+def alert_status(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([alert.status])
+    return([alert.get('status')])
+
+
+def compliance_metadata(alert):
+    if isinstance(alert, RedLockAlertRecord):
+        return([(c.standardName, c.requirementId, c.sectionId) for c in alert.complianceMetadata or ()])
+    output = []
+    for c in (alert.get('policy') or {}).get('complianceMetadata') or []:
+        output.append((c.get('standardName'), c.get('requirementId'), c.get('sectionId')))
+    return(output)
+
+
+def alert_standard(alert):
+    return(list(dict.fromkeys(c[0] for c in compliance_metadata(alert))))
+
+
+def alert_requirement(alert):
+    '''(standardName, requirementId)'''
+    return(list(dict.fromkeys(c[:2] for c in compliance_metadata(alert))))
+
+
+def alert_section(alert):
+    '''(standardName, requirementId, sectionId)'''
+    return(list(dict.fromkeys(compliance_metadata(alert))))
+
+
+dimensions = {
+    "account": alert_account,
+    "account_name": alert_account_name,
+    "cloud_type": alert_cloud_type,
+    "policy": alert_policy,
+    "severity": alert_severity,
+    "status": alert_status,
+    "standard": alert_standard,
+    "requirement": alert_requirement,
+    "section": alert_section,
+}
+
+# Dimensions that can give an alert several values (or none)
+multi_valued = {"standard", "requirement", "section"}
+
+default_group_bys = [
+    ("account",),
+    ("policy",),
+    ("severity",),
+    ("standard",),
+    ("requirement",),
+    ("section",),
+    ("account", "section"), # the posture matrix
+]
+
+
+class RedLockAlertAggregator(object):
+    """
+    Group-by alert counts computed in one pass over an alert stream (eg alerts.iter_alerts() or a
+    RedLockAlertQuery). Alerts can be dicts or records.RedLockAlertRecord. Only the counters are
+    kept, so memory depends on the number of distinct keys, not on the number of alerts.
+
+        agg = aggregate.RedLockAlertAggregator()
+        agg.consume(group.iter_alerts())
+        agg.counts("severity")             # Counter({"high": 10, ...})
+        agg.posture_matrix()               # {accountId: {standardName: {sectionId: n}}}
+
+    group_bys is a list of tuples of dimension names (see dimensions). An alert mapped to several
+    compliance sections counts once per section.
+
+    With NumPy installed (and use_numpy not False) keys are dictionary-encoded into integer columns
+    and counted with vectorized rollups every batch_size alerts instead of one dict update per key.
+    """
+
+    batch_size = 50000
+
+    def __init__(self, group_bys=None, use_numpy=None, batch_size=None):
+        self.group_bys = [tuple(g) for g in (group_bys or default_group_bys)]
+        for group_by in self.group_bys:
+            for d in group_by:
+                if d not in dimensions:
+                    raise ValueError(f"Unknown alert dimension {d!r}. Known: {', '.join(dimensions)}")
+        self.dimensions = list(dict.fromkeys(d for g in self.group_bys for d in g))
+        if use_numpy and numpy is None:
+            raise ImportError("use_numpy=True requires numpy. pip install numpy")
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        self.alerts = 0
+        self.counters = {g: collections.Counter() for g in self.group_bys}
+
+        # NumPy path: value <-> code per dimension, and the pending batch as one code column per
+        # dimension. Multi valued dimensions are stored exploded, with the row of the alert each code
+        # belongs to. Group bys over two multi valued dimensions are always counted directly.
+        self.codes = {d: {} for d in self.dimensions}
+        self.values = {d: [] for d in self.dimensions}
+        self.vectorized = [g for g in self.group_bys if len(multi_valued.intersection(g)) < 2]
+        self.direct = [g for g in self.group_bys if g not in self.vectorized] if self.use_numpy else self.group_bys
+        self.columns = {d: [] for d in self.dimensions}
+        self.rows = {d: [] for d in self.dimensions if d in multi_valued}
+        self.pending = 0
+
+    def __repr__(self):
+        return(f"<RedLockAlertAggregator {self.alerts} alerts, {len(self.group_bys)} group bys>")
+
+    def __encode__(self, dimension, value):
+        codes = self.codes[dimension]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.values[dimension].append(value)
+        return(code)
+
+    def add(self, alert):
+        '''Count one alert'''
+        self.alerts += 1
+        values = {d: dimensions[d](alert) for d in self.dimensions}
+        for group_by in self.direct:
+            self.counters[group_by].update(itertools.product(*[values[d] for d in group_by]))
+        if not self.use_numpy:
+            return
+
+        row = self.pending
+        for d, vs in values.items():
+            if d in multi_valued:
+                for v in vs:
+                    self.columns[d].append(self.__encode__(d, v))
+                    self.rows[d].append(row)
+            else:
+                self.columns[d].append(self.__encode__(d, vs[0]))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def consume(self, alert_stream):
+        '''Count every alert of an iterable. Returns self'''
+        for alert in alert_stream:
+            self.add(alert)
+        self.flush()
+        return(self)
+
+    def flush(self):
+        '''Fold the pending NumPy batch into the counters'''
+        if not self.pending:
+            return
+        columns = {d: numpy.asarray(c, dtype=numpy.int64) for d, c in self.columns.items()}
+        for group_by in self.vectorized:
+            multi = [d for d in group_by if d in multi_valued]
+            if multi:
+                # One entry per (alert, value of the multi valued dimension)
+                rows = numpy.asarray(self.rows[multi[0]], dtype=numpy.int64)
+                keys = [columns[d] if d == multi[0] else columns[d][rows] for d in group_by]
+            else:
+                keys = [columns[d] for d in group_by]
+            if not len(keys[0]):
+                continue
+            shape = [len(self.values[d]) for d in group_by]
+            combined, counts = numpy.unique(numpy.ravel_multi_index(keys, shape), return_counts=True)
+            counter = self.counters[group_by]
+            for index, count in zip(zip(*[i.tolist() for i in numpy.unravel_index(combined, shape)]), counts.tolist()):
+                counter[tuple(self.values[d][i] for d, i in zip(group_by, index))] += count
+        self.columns = {d: [] for d in self.dimensions}
+        self.rows = {d: [] for d in self.rows}
+        self.pending = 0
+
+    def merge(self, other):
+        '''Add the counts of another aggregator (eg one per worker). Returns self'''
+        self.flush()
+        other.flush()
+        self.alerts += other.alerts
+        for group_by, counter in other.counters.items():
+            self.counters.setdefault(group_by, collections.Counter()).update(counter)
+        return(self)
+
+    def counts(self, *group_by):
+        '''Counter for one group by, eg counts("severity") or counts("account", "standard").
+        Single dimension group bys are keyed by the value, others by a tuple of values'''
+        self.flush()
+        group_by = tuple(group_by)
+        if group_by not in self.counters:
+            raise KeyError(f"Not aggregated by {group_by}. Add it to group_bys")
+        counter = self.counters[group_by]
+        if len(group_by) == 1:
+            return(collections.Counter({k[0]: v for k, v in counter.items()}))
+        return(collections.Counter(counter))
+
+    def posture_matrix(self):
+        '''Alert counts per account, standard and section: {accountId: {standardName: {sectionId: n}}}'''
+        output = {}
+        for (account_id, (standard_name, requirement_id, section_id)), count in self.counts("account", "section").items():
+            sections = output.setdefault(account_id, {}).setdefault(standard_name, {})
+            sections[section_id] = sections.get(section_id, 0) + count
+        return(output)
+
+    def summary(self):
+        '''Plain dict of every group by, for JSON dumps. Tuple keys are joined with "/"'''
+        output = {"alerts": self.alerts}
+        for group_by in self.group_bys:
+            counter = self.counts(*group_by)
+            output["+".join(group_by)] = {key_label(k): v for k, v in counter.most_common()}
+        return(output)
+
+
+def key_label(key):
+    if isinstance(key, tuple):
+        return("/".join(key_label(k) for k in key))
+    return(str(key))
+
+
+def aggregate_alerts(api, querystring, group_bys=None, use_numpy=None):
+    '''Stream the alerts matching querystring through a RedLockAlertAggregator and return it'''
+    return(RedLockAlertAggregator(group_bys=group_bys, use_numpy=use_numpy).consume(alerts.iter_alerts(api, querystring)))
@@ -0,0 +1,279 @@
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+import collections
+
+import logging
+logger = logging.getLogger()
+
+from redlock_sdk.alerts import RedLockAlertQuery, absolute_time_range, default_time_range
+
+
+schema = """
+CREATE TABLE IF NOT EXISTS alert (
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    policy_id TEXT,
+    account_id TEXT,
+    alert_time INTEGER,
+    last_updated INTEGER,
+    synced_at REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alert_status ON alert (status);
+CREATE INDEX IF NOT EXISTS alert_policy ON alert (policy_id);
+CREATE INDEX IF NOT EXISTS alert_account ON alert (account_id);
+CREATE TABLE IF NOT EXISTS transition (
+    alert_id TEXT NOT NULL,
+    from_status TEXT,
+    to_status TEXT,
+    at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transition_alert ON transition (alert_id);
+CREATE INDEX IF NOT EXISTS transition_at ON transition (at);
+CREATE TABLE IF NOT EXISTS watermark (
+    query TEXT PRIMARY KEY,
+    filters TEXT NOT NULL,
+    watermark INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def query_key(filters):
+    '''Stable name for a set of v2/alert filters'''
+    return(hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+
+
+class RedLockAlertStore(object):
+    """
+    Local SQLite copy of alerts, kept current by RedLockAlertSync.
+
+    Every alert is stored once (latest version wins). When a stored alert comes back with a
+    different status (open -> resolved/dismissed, or reopened) the change is recorded in the
+    transition table. Sync watermarks live in the same file, so a sync picks up where the last
+    run stopped.
+    """
+
+    def __init__(self, path=":memory:", codec=None):
+        self.path = path
+        self.codec = codec
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(schema)
+
+    def __repr__(self):
+        return(f"<RedLockAlertStore {self.path}>")
+
+    def __len__(self):
+        with self.lock:
+            return(self.db.execute("SELECT COUNT(*) FROM alert").fetchone()[0])
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return(False)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def dumps(self, alert):
+        return(self.codec.dumps(alert) if self.codec is not None else json.dumps(alert).encode("utf-8"))
+
+    def loads(self, data):
+        return(self.codec.loads(data) if self.codec is not None else json.loads(data))
+
+    def merge(self, alerts, now=None):
+        '''Upsert alerts, recording status transitions. Returns {"new": n, "updated": n, "unchanged": n,
+        "transitions": Counter((from, to))}'''
+        now = now or time.time()
+        summary = {"new": 0, "updated": 0, "unchanged": 0, "transitions": collections.Counter()}
+        with self.lock, self.db:
+            for alert in alerts:
+                alert_id = str(alert['id'])
+                status = alert.get('status')
+                last_updated = alert.get('lastUpdated')
+                row = self.db.execute("SELECT status, last_updated FROM alert WHERE id = ?", (alert_id,)).fetchone()
+                if row is None:
+                    summary['new'] += 1
+                elif row[0] == status and row[1] == last_updated:
+                    summary['unchanged'] += 1
+                    continue
+                else:
+                    summary['updated'] += 1
+                    if row[0] != status:
+                        summary['transitions'][(row[0], status)] += 1
+                        self.db.execute("INSERT INTO transition (alert_id, from_status, to_status, at) VALUES (?, ?, ?, ?)",
+                                        (alert_id, row[0], status, last_updated or int(now * 1000)))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO alert (id, status, policy_id, account_id, alert_time, last_updated, synced_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (alert_id, status, alert.get('policyId') or (alert.get('policy') or {}).get('policyId'),
+                     (alert.get('resource') or {}).get('accountId'), alert.get('alertTime'), last_updated,
+                     now, self.dumps(alert)))
+        return(summary)
+
+    def get(self, alert_id):
+        with self.lock:
+            row = self.db.execute("SELECT data FROM alert WHERE id = ?", (str(alert_id),)).fetchone()
+        return(self.loads(row[0]) if row else None)
+
+    def find(self, status=None, policy_id=None, account_id=None):
+        '''Stored alerts, optionally filtered by status, policy id and/or account id'''
+        sql = "SELECT data FROM alert WHERE 1 = 1"
+        args = []
+        for column, value in [("status", status), ("policy_id", policy_id), ("account_id", account_id)]:
+            if value is not None:
+                sql += f" AND {column} = ?"
+                args.append(value)
+        with self.lock:
+            rows = self.db.execute(sql + " ORDER BY alert_time", args).fetchall()
+        return([self.loads(r[0]) for r in rows])
+
+    def ids(self, statuses=None):
+        '''Ids of the stored alerts, optionally only those with one of statuses'''
+        sql = "SELECT id FROM alert"
+        args = []
+        if statuses:
+            sql += f" WHERE status IN ({', '.join('?' for s in statuses)})"
+            args = list(statuses)
+        with self.lock:
+            return([r[0] for r in self.db.execute(sql, args).fetchall()])
+
+    def status_counts(self):
+        with self.lock:
+            return(dict(self.db.execute("SELECT status, COUNT(*) FROM alert GROUP BY status").fetchall()))
+
+    def transitions(self, alert_id=None, since=None):
+        '''[(alert_id, from_status, to_status, at)], oldest first. since is epoch ms'''
+        sql = "SELECT alert_id, from_status, to_status, at FROM transition WHERE 1 = 1"
+        args = []
+        if alert_id is not None:
+            sql += " AND alert_id = ?"
+            args.append(str(alert_id))
+        if since is not None:
+            sql += " AND at >= ?"
+            args.append(since)
+        with self.lock:
+            return(self.db.execute(sql + " ORDER BY at", args).fetchall())
+
+    def watermark(self, query):
+        '''Last checkpoint (epoch ms) for a query key, or None'''
+        with self.lock:
+            row = self.db.execute("SELECT watermark FROM watermark WHERE query = ?", (query,)).fetchone()
+        return(row[0] if row else None)
+
+    def set_watermark(self, query, filters, watermark):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO watermark (query, filters, watermark, synced_at) VALUES (?, ?, ?, ?)",
+                            (query, json.dumps(filters, sort_keys=True, default=str), int(watermark), time.time()))
+
+    def reset_watermark(self, query):
+        '''Make the next sync of query a full one'''
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM watermark WHERE query = ?", (query,))
+
+
+class RedLockAlertSync(object):
+    """
+    Incremental sync of the alerts matching some v2/alert filters into a RedLockAlertStore.
+
+        store = alert_store.RedLockAlertStore("alerts.db", codec=rl_api.codec)
+        sync = alert_store.RedLockAlertSync(rl_api, store, {"account.group": "prod"})
+        sync.sync()   # first run: full history. Later runs: only the window since the last checkpoint
+
+    The first sync (no watermark yet) downloads everything for all time. Every later sync asks
+    for an absolute window from the previous watermark (less overlap, for late arriving updates)
+    up to now, and moves the watermark only once that window has been merged.
+
+    The watermark is an alertTime (epoch ms): v2/alert time ranges filter on when an alert was
+    raised, not on when it last changed. So the window only brings new alerts. Stored alerts
+    still in one of recheck_statuses that the window didn't return are re-read by id, which is
+    how older alerts that were resolved or dismissed since are seen.
+    filters should not restrict alert.status, or resolutions and dismissals are never seen.
+    """
+
+    # Re-read this much before the watermark (ms) to cover clock skew and late updates
+    overlap = 15 * 60 * 1000
+    # Stored alerts in these states are re-read every sync, their status can still change
+    recheck_statuses = ("open",)
+    # Alert ids per re-check request (keeps URLs a sane length)
+    recheck_batch_size = 100
+
+    def __init__(self, api, store, filters=None, name=None, overlap=None, page_size=None):
+        self.api = api
+        self.store = store
+        self.filters = {k: v for k, v in (filters or {}).items() if k not in ("timeType", "timeUnit", "timeAmount", "startTime", "endTime")}
+        if "alert.status" in self.filters:
+            logger.warning("Syncing alerts filtered on alert.status: status transitions out of it won't be seen")
+        self.name = name or query_key(self.filters)
+        if overlap is not None:
+            self.overlap = overlap
+        self.page_size = page_size
+
+    def __repr__(self):
+        return(f"<RedLockAlertSync {self.name} {self.filters}>")
+
+    def window(self, now_ms):
+        '''The time filters for the next sync'''
+        watermark = self.store.watermark(self.name)
+        if watermark is None:
+            return({"timeType": "to_now", "timeUnit": "epoch"})
+        return(absolute_time_range(max(0, watermark - self.overlap), now_ms))
+
+    def sync(self):
+        '''Fetch the alerts since the last checkpoint, re-check the stored ones that can still
+        change, and merge them. Returns the merge summary plus "fetched", "rechecked" and the
+        "window" used'''
+        now_ms = int(time.time() * 1000)
+        incremental = self.store.watermark(self.name) is not None
+        window = self.window(now_ms)
+        filters = dict(self.filters)
+        filters.update(window)
+        logger.debug(f"Alert sync {self.name}: {window}")
+
+        query = RedLockAlertQuery(self.api, filters, page_size=self.page_size)
+        summary = {"fetched": 0, "rechecked": 0, "new": 0, "updated": 0, "unchanged": 0, "transitions": collections.Counter()}
+        seen = set()
+        for page in query.pages():
+            seen.update(str(a['id']) for a in page)
+            self.__merge__(summary, page)
+
+        if incremental:
+            stale = [i for i in self.store.ids(self.recheck_statuses) if i not in seen]
+            summary['rechecked'] = len(stale)
+            for page in self.recheck(stale):
+                self.__merge__(summary, page)
+
+        # Only now is the window complete
+        self.store.set_watermark(self.name, self.filters, now_ms)
+        summary['window'] = window
+        return(summary)
+
+    def __merge__(self, summary, alerts):
+        summary['fetched'] += len(alerts)
+        merged = self.store.merge(alerts)
+        for k in ("new", "updated", "unchanged"):
+            summary[k] += merged[k]
+        summary['transitions'].update(merged['transitions'])
+
+    def recheck(self, alert_ids):
+        '''The current version of alert_ids, any time and any status, recheck_batch_size ids per
+        request run concurrently. Returns a list of pages'''
+        def fetch(chunk):
+            filters = dict(self.filters)
+            filters.update(default_time_range)
+            filters['alert.id'] = chunk
+            return(list(RedLockAlertQuery(self.api, filters, page_size=self.page_size)))
+        chunks = [alert_ids[i:i + self.recheck_batch_size] for i in range(0, len(alert_ids), self.recheck_batch_size)]
+        pages = self.api.map_call([functools.partial(fetch, c) for c in chunks])
+        for page in pages:
+            if isinstance(page, Exception):
+                raise page
+        return(pages)
@@ -0,0 +1,497 @@
+import math
+import time
+import queue
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+logger = logging.getLogger()
+
+from redlock_sdk.stream import JSONArrayStream
+from redlock_sdk.rate_limit import backoff
+
+
+# Bytes read from the socket per parse step when streaming alerts
+stream_chunk_size = 1 << 16
+
+# Alert filters used when the caller doesn't give a time range: everything, for all time
+default_time_range = {
+    "timeType": "to_now",
+    "timeUnit": "epoch",
+}
+
+
+def absolute_time_range(start, end):
+    '''v2/alert filters for alerts between two epoch times in milliseconds'''
+    return({
+        "timeType": "absolute",
+        "startTime": int(start),
+        "endTime": int(end),
+    })
+
+
+def iter_alerts(api, querystring, path="v2/alert"):
+    '''Stream the alerts matching querystring, yielding one alert dict at a time.
+    The response body is parsed incrementally, so memory use doesn't grow with the result set.'''
+    response = api.get_stream(path, params=querystring)
+    with response:
+        yield from JSONArrayStream(response.iter_content(chunk_size=stream_chunk_size))
+
+
+class RedLockAlertQuery(object):
+    """
+    Every alert matching a set of v2/alert filters, fetched one page at a time with limit/pageToken.
+    While the caller works through one page, the next one is already being downloaded.
+
+    filters are the same querystring the get_alerts() methods build, eg
+
+        query = alerts.RedLockAlertQuery(rl_api, group.alert_querystring(policy_type="config"))
+        for alert in query:
+            ...
+        async for alert in alerts.RedLockAlertQuery(async_rl_api, {"alert.status": "open"}):
+            ...
+
+    Works with RedLockAPI (a background thread prefetches) and AsyncRedLockAPI (a task prefetches).
+    """
+
+    # Alerts per page
+    page_size = 1000
+
+    def __init__(self, api, filters=None, page_size=None, path="v2/alert"):
+        self.api = api
+        self.path = path
+        self.filters = {}
+        if "timeType" not in (filters or {}):
+            self.filters.update(default_time_range)
+        self.filters.update(filters or {})
+        if page_size is not None:
+            self.page_size = page_size
+        self.total_rows = None
+
+    def __repr__(self):
+        return(f"<RedLockAlertQuery {self.filters}>")
+
+    def page_params(self, page_token=None):
+        params = dict(self.filters)
+        params["limit"] = self.page_size
+        if page_token:
+            params["pageToken"] = page_token
+        return(params)
+
+    def __page__(self, body):
+        '''Returns (items, next_page_token) from one decoded page'''
+        if isinstance(body, list):
+            # Not paginated, this is everything
+            return(body, None)
+        if self.total_rows is None:
+            self.total_rows = body.get("totalRows")
+        items = body.get("items", [])
+        if not items:
+            return(items, None)
+        return(items, body.get("nextPageToken"))
+
+    def fetch_page(self, page_token=None):
+        '''Fetch one page. Returns (items, next_page_token)'''
+        return(self.__page__(self.api.get_json(self.path, params=self.page_params(page_token))))
+
+    async def afetch_page(self, page_token=None):
+        if asyncio.iscoroutinefunction(self.api.get_json):
+            return(self.__page__(await self.api.get_json(self.path, params=self.page_params(page_token))))
+        return(await asyncio.get_running_loop().run_in_executor(None, self.fetch_page, page_token))
+
+    def pages(self):
+        '''Yield each page's list of alerts, prefetching the following page in the background'''
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(self.fetch_page, None)
+            while future is not None:
+                items, token = future.result()
+                future = executor.submit(self.fetch_page, token) if token else None
+                yield items
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def apages(self):
+        '''async version of pages()'''
+        task = asyncio.ensure_future(self.afetch_page(None))
+        try:
+            while task is not None:
+                items, token = await task
+                task = asyncio.ensure_future(self.afetch_page(token)) if token else None
+                yield items
+        finally:
+            if task is not None:
+                task.cancel()
+
+    def __iter__(self):
+        for items in self.pages():
+            yield from items
+
+    async def __aiter_alerts__(self):
+        async for items in self.apages():
+            for alert in items:
+                yield alert
+
+    def __aiter__(self):
+        return(self.__aiter_alerts__())
+
+
+class RedLockAlertFanOut(object):
+    """
+    Runs many v2/alert queries (eg one per account of a group) on a bounded thread pool and merges
+    them into one stream of (key, alert) pairs, in whatever order the pages arrive.
+
+        fan_out = alerts.RedLockAlertFanOut(rl_api, {a: a.alert_querystring() for a in accounts})
+        for cloud_account, alert in fan_out:
+            ...
+        fan_out.errors   # {key: exception} for the queries that failed, the others still ran
+
+    queries maps any hashable key to its filters. Pages are handed over as they are downloaded.
+    Leaving the loop early stops the remaining queries after their current page.
+    """
+
+    # Pages waiting to be consumed before the workers pause
+    max_pending_pages = 16
+
+    def __init__(self, api, queries, max_workers=None, page_size=None):
+        self.api = api
+        self.queries = dict(queries)
+        self.max_workers = max_workers or getattr(api, "pool_maxsize", 10)
+        self.page_size = page_size
+        self.counts = {} # key -> alerts received
+        self.errors = {} # key -> exception
+        self.done = set()
+
+    def __repr__(self):
+        return(f"<RedLockAlertFanOut {len(self.queries)} queries>")
+
+    @staticmethod
+    def __put__(results, stop, item):
+        '''Queue item unless the consumer has gone away'''
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __run__(self, key, filters, results, stop):
+        try:
+            query = RedLockAlertQuery(self.api, filters, page_size=self.page_size)
+            token = None
+            while not stop.is_set():
+                items, token = query.fetch_page(token)
+                self.__put__(results, stop, (key, items, None))
+                if not token:
+                    break
+        except Exception as e:
+            self.__put__(results, stop, (key, None, e))
+        finally:
+            self.__put__(results, stop, (key, None, StopIteration))
+
+    def __iter__(self):
+        if not self.queries:
+            return
+        results = queue.Queue(maxsize=self.max_pending_pages)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.queries)))
+        try:
+            for key, filters in self.queries.items():
+                self.counts[key] = 0
+                executor.submit(self.__run__, key, filters, results, stop)
+
+            running = len(self.queries)
+            while running:
+                key, items, error = results.get()
+                if error is StopIteration:
+                    running -= 1
+                    self.done.add(key)
+                elif error is not None:
+                    logger.error(f"Alert query for {key} failed: {error}")
+                    self.errors[key] = error
+                else:
+                    self.counts[key] += len(items)
+                    for alert in items:
+                        yield (key, alert)
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def by_key(self):
+        '''Run everything and return {key: [alerts]}'''
+        output = {key: [] for key in self.queries}
+        for key, alert in self:
+            output[key].append(alert)
+        return(output)
+
+
+class RedLockAlertTimeSlicer(object):
+    """
+    Fetches a large alert window as many absolute sub-windows in parallel, instead of one huge request.
+
+        slicer = alerts.RedLockAlertTimeSlicer(rl_api, group.alert_querystring(), start=start_ms)
+        for alert in slicer:
+            ...
+
+    The window sizes adapt to the data: each window's size is probed (a limit=1 request reports
+    totalRows) and windows holding more than target_rows are cut into proportionally smaller ones,
+    down to min_window. The windows are then fetched concurrently and yielded oldest window first,
+    each one as soon as it and every window before it is complete. At most max_buffered_windows
+    windows are fetched ahead of the one being yielded, so a slow window doesn't pile the later
+    ones up in memory. An alert returned by two neighbouring windows (it sits on the boundary) is
+    only yielded once.
+
+    A window that failed is skipped. Its exception is put in errors (keyed by its index in
+    windows) as soon as it fails, so a caller that stops early still sees it.
+
+    start and end are epoch milliseconds, default all time up to now. Any time filters in filters
+    are replaced.
+    """
+
+    # Alerts per window to aim for
+    target_rows = 5000
+    # Never cut windows shorter than this (ms)
+    min_window = 60 * 1000
+    # Give up refining after this many probe rounds
+    max_rounds = 4
+    # Windows fetched (or held) ahead of the one being yielded
+    max_buffered_windows = 8
+
+    def __init__(self, api, filters=None, start=None, end=None, target_rows=None, max_workers=None, page_size=None):
+        self.api = api
+        self.filters = {k: v for k, v in (filters or {}).items() if k not in ("timeType", "timeUnit", "timeAmount", "startTime", "endTime")}
+        self.start = int(start or 0)
+        self.end = int(end or time.time() * 1000)
+        if target_rows is not None:
+            self.target_rows = target_rows
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.windows = None # [(start, end, total rows)] once planned
+        self.errors = {}
+
+    def __repr__(self):
+        return(f"<RedLockAlertTimeSlicer {self.start}-{self.end} {self.filters}>")
+
+    def window_filters(self, start, end):
+        filters = dict(self.filters)
+        filters.update(absolute_time_range(start, end))
+        return(filters)
+
+    def probe(self, windows):
+        '''totalRows of each (start, end) window, fetched concurrently'''
+        def count(window):
+            query = RedLockAlertQuery(self.api, self.window_filters(*window), page_size=1)
+            items, token = query.fetch_page()
+            return(query.total_rows if query.total_rows is not None else len(items))
+        results = self.api.map_call([functools.partial(count, w) for w in windows], max_workers=self.max_workers)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return(results)
+
+    def plan(self):
+        '''Cut [start, end] into windows of about target_rows alerts. Returns [(start, end, total rows)]'''
+        windows = [(self.start, self.end, self.probe([(self.start, self.end)])[0])]
+        for _ in range(self.max_rounds):
+            planned = []
+            to_split = []
+            for start, end, total in windows:
+                width = end - start + 1
+                if total <= self.target_rows or width <= self.min_window:
+                    planned.append((start, end, total))
+                    continue
+                # Non-overlapping sub-windows, sized assuming the alerts are spread evenly
+                parts = min(math.ceil(total / self.target_rows), max(1, width // self.min_window))
+                step = math.ceil(width / parts)
+                for s in range(start, end + 1, step):
+                    to_split.append((s, min(end, s + step - 1)))
+            if not to_split:
+                break
+            windows = planned + [(s, e, t) for (s, e), t in zip(to_split, self.probe(to_split))]
+
+        # Empty windows need no request
+        self.windows = sorted(w for w in windows if w[2])
+        logger.debug(f"Alert window {self.start}-{self.end} cut into {len(self.windows)} windows")
+        return(self.windows)
+
+    def fetch_window(self, start, end):
+        '''Every alert of one window'''
+        output = []
+        for page in RedLockAlertQuery(self.api, self.window_filters(start, end), page_size=self.page_size).pages():
+            output.extend(page)
+        return(output)
+
+    def __failed__(self, index, error):
+        if index not in self.errors:
+            logger.error(f"Alert window {self.windows[index][:2]} failed: {error}")
+            self.errors[index] = error
+
+    def __iter__(self):
+        windows = self.plan() if self.windows is None else self.windows
+        if not windows:
+            return
+        self.errors = {}
+        ahead = max(1, self.max_buffered_windows)
+        max_workers = self.max_workers or getattr(self.api, "pool_maxsize", 10)
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, ahead, len(windows)))
+
+        def done(index, future):
+            if not future.cancelled() and future.exception() is not None:
+                self.__failed__(index, future.exception())
+
+        futures = {}
+        submitted = 0
+        previous_ids = set()
+        try:
+            for index in range(len(windows)):
+                while submitted < len(windows) and submitted - index < ahead:
+                    start, end, total = windows[submitted]
+                    futures[submitted] = executor.submit(self.fetch_window, start, end)
+                    futures[submitted].add_done_callback(functools.partial(done, submitted))
+                    submitted += 1
+
+                try:
+                    items = futures.pop(index).result()
+                except Exception as e:
+                    self.__failed__(index, e)
+                    items = []
+                ids = set()
+                for alert in items:
+                    alert_id = alert.get('id')
+                    ids.add(alert_id)
+                    if alert_id not in previous_ids:
+                        yield alert
+                previous_ids = ids
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def alert_ids(alert_stream):
+    '''Alert ids as strings, from ids, alert dicts or records'''
+    output = []
+    for alert in alert_stream:
+        if isinstance(alert, dict):
+            alert = alert['id']
+        elif hasattr(alert, "id"):
+            alert = alert.id
+        output.append(str(alert))
+    return(list(dict.fromkeys(output)))
+
+
+class RedLockAlertBulkAction(object):
+    """
+    Dismisses or reopens many alerts with as few alert/dismiss or alert/reopen requests as possible.
+
+        action = alerts.RedLockAlertBulkAction(rl_api, "dismiss", note="Accepted risk", scope=cloud_account)
+        outcomes = action.run(alert_ids)   # {alert_id: "dismissed" | "out_of_scope" | exception}
+
+    targets is an iterable of alert ids (or alert dicts) or a dict of v2/alert filters, which is
+    listed once to find the ids. The ids are sent max_batch_size at a time, the chunks run
+    concurrently through the client's rate limiter and a failed chunk is retried with backoff
+    before its alerts get the exception as their outcome.
+
+    With a scope (a cloud account or account group) the alerts are checked to belong to it with
+    one v2/alert query for the scope; ids it doesn't return are not sent.
+    """
+
+    # Alert ids per request
+    max_batch_size = 500
+    # Extra attempts for a chunk that failed
+    chunk_retries = 2
+    # Up to this many ids, the scope check only lists those alerts (keeps the URL a sane length)
+    max_id_filters = 100
+
+    actions = {
+        "dismiss": ("alert/dismiss", "dismissed"),
+        "reopen": ("alert/reopen", "reopened"),
+    }
+
+    def __init__(self, api, action, note=None, scope=None, max_batch_size=None, max_workers=None):
+        if action not in self.actions:
+            raise ValueError(f"Unknown alert action {action!r}. Known: {', '.join(self.actions)}")
+        if action == "dismiss" and not note:
+            raise ValueError("Dismissing alerts requires a dismissal note")
+        self.api = api
+        self.action = action
+        self.note = note
+        self.scope = scope
+        if max_batch_size is not None:
+            self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+
+    def __repr__(self):
+        return(f"<RedLockAlertBulkAction {self.action} scope={self.scope}>")
+
+    def scope_filters(self):
+        '''v2/alert filters for every alert of the scope, any status'''
+        return({k: v for k, v in self.scope.alert_querystring(status=None).items() if v is not None})
+
+    def resolve(self, targets):
+        '''(ids to send, ids outside the scope)'''
+        if isinstance(targets, dict):
+            filters = dict(targets)
+            if self.scope is not None:
+                # The scope's filters narrow the query, so everything it returns is in scope
+                filters = dict(self.scope_filters(), **filters)
+            return(alert_ids(RedLockAlertQuery(self.api, filters)), [])
+
+        ids = alert_ids(targets)
+        if self.scope is None or not ids:
+            return(ids, [])
+        filters = self.scope_filters()
+        if len(ids) <= self.max_id_filters:
+            filters['alert.id'] = ids
+        in_scope = set(alert_ids(RedLockAlertQuery(self.api, filters)))
+        return([i for i in ids if i in in_scope], [i for i in ids if i not in in_scope])
+
+    def payload(self, chunk):
+        data = {
+            "alerts": chunk,
+            "filter": {"timeRange": {"type": "to_now", "value": "epoch"}},
+        }
+        if self.action == "dismiss":
+            data['dismissalNote'] = self.note
+        return(data)
+
+    def __send__(self, chunk):
+        '''POST one chunk, retrying it with backoff. Returns None or the last exception'''
+        path = self.actions[self.action][0]
+        for attempt in range(self.chunk_retries + 1):
+            try:
+                self.api.post(path, data=self.payload(chunk))
+                return(None)
+            except Exception as e:
+                error = e
+                if attempt < self.chunk_retries:
+                    delay = backoff(attempt)
+                    logger.warning(f"{path} for {len(chunk)} alerts failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+        return(error)
+
+    def run(self, targets):
+        '''Apply the action. Returns {alert_id: outcome} where outcome is "dismissed"/"reopened",
+        "out_of_scope", or the exception of the chunk that failed'''
+        ids, out_of_scope = self.resolve(targets)
+        outcomes = {i: "out_of_scope" for i in out_of_scope}
+
+        chunks = [ids[start:start + self.max_batch_size] for start in range(0, len(ids), self.max_batch_size)]
+        done = self.actions[self.action][1]
+        errors = self.api.map_call([functools.partial(self.__send__, c) for c in chunks], max_workers=self.max_workers)
+        for chunk, error in zip(chunks, errors):
+            for i in chunk:
+                outcomes[i] = done if error is None else error
+        logger.debug(f"{self.action} of {len(ids)} alerts in {len(chunks)} requests")
+        return(outcomes)
+
+
+def dismiss_alerts(api, targets, note, scope=None, max_batch_size=None, max_workers=None):
+    '''Dismiss alert ids (or the alerts matching a dict of filters). See RedLockAlertBulkAction'''
+    return(RedLockAlertBulkAction(api, "dismiss", note=note, scope=scope, max_batch_size=max_batch_size,
+                                  max_workers=max_workers).run(targets))
+
+
+def reopen_alerts(api, targets, scope=None, max_batch_size=None, max_workers=None):
+    '''Reopen dismissed alert ids (or the alerts matching a dict of filters). See RedLockAlertBulkAction'''
+    return(RedLockAlertBulkAction(api, "reopen", scope=scope, max_batch_size=max_batch_size,
+                                  max_workers=max_workers).run(targets))
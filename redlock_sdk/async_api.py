@@ -0,0 +1,606 @@
+import json
+import ssl
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import logging
+logger = logging.getLogger()
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from redlock_sdk.redlock_api import RedLockAPI, RedLockAPIUnauthenticated, check_response
+from redlock_sdk.cache import cache_key, top_level_resource
+from redlock_sdk.codec import RedLockCodec, get_codec
+from redlock_sdk.identity import RedLockIdentityMap
+from redlock_sdk.rate_limit import RedLockRateLimiter, parse_retry_after, backoff
+
+
+class AsyncRedLockAPI(object):
+    """
+    asyncio flavour of RedLockAPI. Same calls, same exceptions, but every request is awaitable
+    and up to max_concurrency requests can be in flight at once from a single event loop.
+
+    Requires aiohttp. Usage:
+
+        async with AsyncRedLockAPI(endpoint, customerName="acme", max_concurrency=200) as api:
+            await api.authenticate(username)
+            groups = await asyncio.gather(*[api.get(f"cloud/group/{i}") for i in ids])
+
+    The account, standard and report classes are synchronous. Rather than duplicating them, build
+    them through run()/build(): they execute in a worker thread against api.sync, a blocking facade
+    whose requests are scheduled back onto this event loop (so they share the concurrency limit).
+
+        acct = await api.build(account.RedLockAWSAccount, "123456789012")
+        alerts = await api.run(acct.get_alerts)
+    """
+
+    # Max number of requests in flight at once
+    max_concurrency = 50
+
+    max_retries = RedLockAPI.max_retries
+    idempotent_methods = RedLockAPI.idempotent_methods
+    coalesce = RedLockAPI.coalesce
+    token_lifetime = RedLockAPI.token_lifetime
+    token_refresh_margin = RedLockAPI.token_refresh_margin
+
+    def __init__(self, endpoint, customerName=None, debug=False, max_concurrency=None, rate_limit=None, metrics=None, codec=None, identity_map=True):
+        super(AsyncRedLockAPI, self).__init__()
+
+        if aiohttp is None:
+            raise ImportError("AsyncRedLockAPI requires aiohttp. pip install aiohttp")
+
+        self.debug = debug
+        if self.debug:
+            logger.setLevel(logging.DEBUG)
+
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+        if isinstance(rate_limit, RedLockRateLimiter):
+            self.rate_limiter = rate_limit
+        else:
+            self.rate_limiter = RedLockRateLimiter(rate=rate_limit)
+
+        self.metrics = metrics
+        self.codec = codec if isinstance(codec, RedLockCodec) else get_codec(codec)
+        self.identity_map = RedLockIdentityMap() if identity_map else None
+
+        self.endpoint = endpoint
+        self.customerName = customerName
+        self.header = None # Set to none and reset after authenticating
+        self.token_expires = None
+        self.auth_generation = 0 # Bumped every time the token changes
+        self._credentials = None # (username, password) kept for re-login
+        self.inflight = {} # (cache_key, write generation) -> Task of the GET currently fetching it
+        self.write_generations = {} # top level resource -> writes to it so far
+
+        self.client = None # aiohttp.ClientSession, created inside the running loop
+        self.semaphore = None
+        self.auth_lock = None
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self.sync = RedLockAPIBridge(self)
+
+    async def __aenter__(self):
+        self.__session__()
+        return(self)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        '''Close the underlying HTTP session and worker threads'''
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        self.executor.shutdown(wait=False)
+
+    def __session__(self):
+        '''Lazily create the aiohttp session, bound to the running loop'''
+        if self.client is None:
+            self.loop = asyncio.get_running_loop()
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.auth_lock = asyncio.Lock()
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             ssl=ssl.create_default_context(cafile=requests.certs.where()))
+            self.client = aiohttp.ClientSession(connector=connector)
+        return(self.client)
+
+    # Keychain / prompt handling is identical to the sync client
+    __get_password__ = RedLockAPI.__get_password__
+
+    async def authenticate(self, username, pw=None):
+        '''Authenticate to RedLock and get a token'''
+        try:
+            if pw:
+                password = pw
+            else:
+                # keyring and getpass block, keep them off the event loop
+                password = await asyncio.get_running_loop().run_in_executor(None, self.__get_password__, username)
+
+            resp = await self.__login__(username, password)
+            if resp.status_code == 200:
+                self.username = username
+                self._credentials = (username, password)
+                return True
+            else:
+                logger.error(f"Failed to authenticate as {username} to {resp.url}: {resp}")
+                return False
+        except Exception as e:
+            logger.error("Exception Authenticating to RedLock: {}".format(e))
+            return False
+
+    async def __login__(self, username, password):
+        '''POST the credentials to /login and install the token on success'''
+        url = "{}/login".format(self.endpoint)
+        if self.customerName is not None:
+            body = {"username":username,"password":password,"customerName":self.customerName}
+        else:
+            body = {"username":username,"password":password}
+
+        resp = await self.__send__("POST", url, json=body, headers={"Content-Type": "application/json"})
+        if resp.status_code == 200:
+            self.__set_token__(resp.json()["token"])
+        return(resp)
+
+    def __set_token__(self, token):
+        '''Install a new token and restart the expiry clock'''
+        self.auth_token = token
+        self.header = {"x-redlock-auth": self.auth_token,"Content-Type": "application/json"}
+        self.token_expires = time.monotonic() + self.token_lifetime
+        self.auth_generation += 1
+
+    async def reauthenticate(self, generation=None, extend=False):
+        '''Refresh the auth token. Single-flight across tasks, see RedLockAPI.reauthenticate()'''
+        self.__session__()
+        async with self.auth_lock:
+            if generation is not None and generation != self.auth_generation:
+                return True
+
+            if extend and self.header is not None:
+                resp = await self.__send__("GET", f"{self.endpoint}/auth_token/extend")
+                if resp.status_code == 200:
+                    self.__set_token__(resp.json()["token"])
+                    return True
+
+            if self._credentials is None:
+                return False
+            logger.info(f"Re-authenticating to RedLock as {self._credentials[0]}")
+            resp = await self.__login__(*self._credentials)
+            if resp.status_code != 200:
+                logger.error(f"Failed to re-authenticate as {self._credentials[0]}: {resp}")
+            return(resp.status_code == 200)
+
+    async def try_wrapper(self, method, path, **kwargs):
+        '''Send a request to the API. Refreshes the token shortly before it expires,
+        and on a 401 re-authenticates once and replays the request. Every send goes through
+        the rate limiter; 429s slow it down and idempotent verbs are retried with jitter.'''
+        url = f"{self.endpoint}/{path}"
+        if self.metrics is not None:
+            started = time.perf_counter()
+        sends = 0
+        for attempt in range(self.max_retries + 1):
+            generation = self.auth_generation
+            if self.token_expires is not None and time.monotonic() > self.token_expires - self.token_refresh_margin:
+                await self.reauthenticate(generation, extend=True)
+                generation = self.auth_generation
+
+            await self.__throttle__()
+            response = await self.__send__(method, url, **kwargs)
+            sends += 1
+            if response.status_code == 401 and await self.reauthenticate(generation):
+                await self.__throttle__()
+                response = await self.__send__(method, url, **kwargs)
+                sends += 1
+
+            if response.status_code != 429:
+                self.rate_limiter.on_success()
+                break
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.on_throttle(retry_after)
+            if method not in self.idempotent_methods or attempt == self.max_retries:
+                break
+            delay = backoff(attempt, retry_after)
+            logger.warning(f"{method} {path} throttled (429), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        if self.metrics is not None:
+            data = kwargs.get("data")
+            if isinstance(response, AsyncRedLockStreamResponse):
+                response_bytes = int(response.headers.get("Content-Length") or 0)
+            else:
+                response_bytes = len(response.content)
+            self.metrics.record(method, path, response.status_code, time.perf_counter() - started,
+                                len(data.encode() if isinstance(data, str) else data or b""),
+                                response_bytes, sends - 1)
+        return(response)
+
+    async def __throttle__(self):
+        wait = self.rate_limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def request_rate(self):
+        '''Sustained requests/second this client has sent over the last minute'''
+        return(self.rate_limiter.sustained_rate())
+
+    async def __send__(self, method, url, headers=None, stream=False, **kwargs):
+        '''Issue one request under the concurrency limit and buffer the body. With stream=True a
+        200 response is returned unread, holding its slot of the limit until it is closed'''
+        client = self.__session__()
+        if not stream:
+            async with self.semaphore:
+                async with client.request(method, url, headers=headers or self.header, **kwargs) as resp:
+                    content = await resp.read()
+                    return(AsyncRedLockResponse(resp, content, self.codec))
+
+        await self.semaphore.acquire()
+        try:
+            resp = await client.request(method, url, headers=headers or self.header, **kwargs)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        if resp.status == 200:
+            return(AsyncRedLockStreamResponse(resp, self.semaphore))
+        # Errors, 401s and 429s are small: buffer them so retries and check_response() work as usual
+        try:
+            content = await resp.read()
+        finally:
+            resp.release()
+            self.semaphore.release()
+        return(AsyncRedLockResponse(resp, content, self.codec))
+
+    async def get(self, path, params=None):
+        '''Executes a GET operation against the API for the path specificed'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot get {path}: Not Authenticated")
+
+        if not self.coalesce:
+            return(await self.__fetch__(path, params))
+
+        # Single-flight: identical GETs in flight share one task. shield() keeps one caller's
+        # cancellation from cancelling the request for everyone else.
+        # A GET made after a write never joins one that started before it
+        key = (cache_key(path, params), self.write_generations.get(top_level_resource(path), 0))
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.__fetch__(path, params))
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self.inflight.pop(key, None) if self.inflight.get(key) is t else None)
+        return(await asyncio.shield(task))
+
+    async def __fetch__(self, path, params=None):
+        url = f"{self.endpoint}/{path}"
+
+        if self.debug:
+            logger.debug(f"Getting {url} with params {params}")
+
+        response = await self.try_wrapper("GET", path, params=encode_params(params))
+
+        if self.debug:
+            logger.debug(f"Response: {response.text}")
+
+        return(check_response(response, ok_statuses=[200]))
+
+    async def get_stream(self, path, params=None):
+        '''GET without reading the body, for very large responses such as v2/alert. Bypasses
+        coalescing. Read it with aiter_content() and aclose() it when done.'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot get {path}: Not Authenticated")
+
+        if self.debug:
+            logger.debug(f"Streaming {self.endpoint}/{path} with params {params}")
+
+        response = await self.try_wrapper("GET", path, params=encode_params(params), stream=True)
+        return(check_response(response, ok_statuses=[200]))
+
+    async def get_json(self, path, params=None):
+        '''get() and decode the body with this client's codec'''
+        return(self.codec.loads((await self.get(path, params=params)).content))
+
+    async def put(self, path, data=None):
+        '''Executes a PUT operation against the API for the path specificed'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot put {path}: Not Authenticated")
+
+        url = f"{self.endpoint}/{path}"
+
+        if self.debug:
+            logger.debug(f"Putting {url} with data {data}")
+
+        response = await self.try_wrapper("PUT", path, data=self.codec.dumps(data))
+        self.__written__(path)
+        return(check_response(response, check_not_found=False))
+
+    async def post(self, path, data=None):
+        '''Executes a POST operation against the API for the path specificed'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot post {path}: Not Authenticated")
+
+        url = f"{self.endpoint}/{path}"
+
+        if self.debug:
+            logger.debug(f"Posting {url} with data {data}")
+
+        response = await self.try_wrapper("POST", path, data=self.codec.dumps(data))
+        self.__written__(path)
+        if self.debug:
+            logger.debug(f"Headers: {response.headers}")
+            logger.debug(f"Body: {response.text}")
+
+        return(check_response(response, check_not_found=False))
+
+    async def delete(self, path):
+        '''Executes a DELETE operation against the API for the path specificed'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot delete {path}: Not Authenticated")
+
+        url = f"{self.endpoint}/{path}"
+
+        if self.debug:
+            logger.debug(f"Deleting {url}")
+
+        response = await self.try_wrapper("DELETE", path)
+        self.__written__(path)
+        if self.debug:
+            logger.debug(f"Headers: {response.headers}")
+            logger.debug(f"Body: {response.text}")
+
+        return(check_response(response))
+
+    def __written__(self, path):
+        '''After a write: stop new GETs of the resource joining ones already in flight'''
+        resource = top_level_resource(path)
+        self.write_generations[resource] = self.write_generations.get(resource, 0) + 1
+
+    async def map_get(self, paths_or_params):
+        '''GET many paths concurrently. Items are a path, or a (path, params) tuple.
+        Returns responses (or the exception raised for that item) in input order.'''
+        calls = []
+        for item in paths_or_params:
+            if isinstance(item, str):
+                calls.append(self.get(item))
+            else:
+                calls.append(self.get(item[0], item[1]))
+        return(await asyncio.gather(*calls, return_exceptions=True))
+
+    async def run(self, func, *args, **kwargs):
+        '''Run a blocking SDK call (model constructor, get_alerts(), ...) in a worker thread.
+        Any requests it makes through api.sync are executed on this event loop.'''
+        self.__session__()
+        return(await self.loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs)))
+
+    async def build(self, cls, *args, **kwargs):
+        '''Instantiate an SDK model class (eg account.RedLockAWSAccount) on top of this client'''
+        return(await self.run(cls, self.sync, *args, **kwargs))
+
+
+class RedLockAPIBridge(object):
+    """
+    Blocking get/put/post/delete facade over an AsyncRedLockAPI, so the synchronous model classes
+    can be used unchanged. Must be called from a worker thread (see AsyncRedLockAPI.run), never
+    from the event loop thread itself.
+    """
+
+    def __init__(self, async_api):
+        self.async_api = async_api
+
+    @property
+    def header(self):
+        return(self.async_api.header)
+
+    @property
+    def debug(self):
+        return(self.async_api.debug)
+
+    @property
+    def codec(self):
+        return(self.async_api.codec)
+
+    @property
+    def identity_map(self):
+        return(self.async_api.identity_map)
+
+    def __call__(self, coro):
+        loop = self.async_api.loop
+        if loop is None:
+            coro.close()
+            raise RedLockAPIUnauthenticated("AsyncRedLockAPI has not been started in an event loop")
+        if self.__in_loop__(loop):
+            coro.close()
+            raise RuntimeError("Blocking call on the event loop thread. Use 'await api.run(...)' instead")
+        return(asyncio.run_coroutine_threadsafe(coro, loop).result())
+
+    @staticmethod
+    def __in_loop__(loop):
+        try:
+            return(asyncio.get_running_loop() is loop)
+        except RuntimeError:
+            return(False)
+
+    def get(self, path, params=None):
+        return(self(self.async_api.get(path, params=params)))
+
+    def get_json(self, path, params=None):
+        return(self(self.async_api.get_json(path, params=params)))
+
+    def get_stream(self, path, params=None):
+        '''The body is read from the event loop one chunk at a time, as iter_content() asks for it'''
+        return(RedLockBridgeStreamResponse(self, self(self.async_api.get_stream(path, params=params))))
+
+    def put(self, path, data=None):
+        return(self(self.async_api.put(path, data=data)))
+
+    def post(self, path, data=None):
+        return(self(self.async_api.post(path, data=data)))
+
+    def delete(self, path):
+        return(self(self.async_api.delete(path)))
+
+    def map_get(self, paths_or_params, max_workers=None):
+        '''Same contract as RedLockAPI.map_get(), concurrency is bounded by the async client'''
+        return(self(self.async_api.map_get(paths_or_params)))
+
+    def map_call(self, calls, max_workers=None):
+        '''Same contract as RedLockAPI.map_call(). Callables run on worker threads, their requests
+        are still bounded by the async client'''
+        calls = list(calls)
+        if not calls:
+            return([])
+
+        def run(call):
+            try:
+                if callable(call):
+                    return(call())
+                verb, path, *args = call
+                return(getattr(self, verb.lower())(path, *args))
+            except Exception as e:
+                return(e)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers or self.async_api.max_concurrency, len(calls))) as executor:
+            return(list(executor.map(run, calls)))
+
+
+class AsyncRedLockResponse(object):
+    """
+    Buffered aiohttp response that quacks like requests.Response, so check_response() and the
+    RedLockAPIError family work unchanged and callers can keep using .json()/.text/.status_code
+    """
+
+    def __init__(self, resp, content, codec=None):
+        self.status_code = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self.url = str(resp.url)
+        self.content = content
+        self.codec = codec
+        self.encoding = resp.charset or "utf-8"
+
+    def __repr__(self):
+        return(f"<AsyncRedLockResponse [{self.status_code}]>")
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass # Already fully read
+
+    @property
+    def text(self):
+        return(self.content.decode(self.encoding or "utf-8", errors="replace"))
+
+    def json(self, **kwargs):
+        if self.codec is not None and not kwargs:
+            return(self.codec.loads(self.content))
+        return(json.loads(self.content, **kwargs))
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.HTTPError(f"{self.status_code} Error: {self.reason} for url: {self.url}", response=self)
+
+
+class AsyncRedLockStreamResponse(object):
+    """
+    A 200 aiohttp response whose body hasn't been read yet. It holds a slot of the client's
+    concurrency limit until aclose().
+    """
+
+    def __init__(self, resp, semaphore):
+        self.resp = resp
+        self.semaphore = semaphore
+        self.status_code = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self.url = str(resp.url)
+        self.encoding = resp.charset or "utf-8"
+        self.closed = False
+
+    def __repr__(self):
+        return(f"<AsyncRedLockStreamResponse [{self.status_code}]>")
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def read_chunk(self, chunk_size):
+        '''Up to chunk_size bytes of the body, b"" at the end'''
+        if self.closed:
+            return(b"")
+        return(await self.resp.content.read(chunk_size))
+
+    async def aiter_content(self, chunk_size=1 << 16):
+        while True:
+            chunk = await self.read_chunk(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.resp.release()
+            self.semaphore.release()
+
+
+class RedLockBridgeStreamResponse(object):
+    """Blocking iter_content()/close() over an AsyncRedLockStreamResponse, for RedLockAPIBridge"""
+
+    def __init__(self, bridge, response):
+        self.bridge = bridge
+        self.response = response
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = response.headers
+        self.url = response.url
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *args):
+        self.close()
+
+    def iter_content(self, chunk_size=1):
+        while True:
+            chunk = self.bridge(self.response.read_chunk(chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.bridge(self.response.aclose())
+
+
+def encode_params(params):
+    '''Normalize query params the way requests does: drop None, bools as True/False, lists repeat the key'''
+    if params is None:
+        return(None)
+    items = params.items() if isinstance(params, dict) else params
+    output = []
+    for k, v in items:
+        if v is None:
+            continue
+        for value in (v if isinstance(v, (list, tuple)) else [v]):
+            output.append((k, str(value)))
+    return(output)
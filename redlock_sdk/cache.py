@@ -0,0 +1,162 @@
+import time
+import fnmatch
+import threading
+import collections
+
+import logging
+logger = logging.getLogger()
+
+
+class RedLockResponseCache(object):
+    """
+    Opt-in LRU cache for GET responses, used by RedLockAPI.get() when the client is built with cache=...
+
+    Only paths with a TTL are cached. ttls maps a path (or fnmatch pattern, eg "compliance/*") to
+    seconds. Once an entry is stale it is revalidated with If-None-Match / If-Modified-Since when the
+    server sent an ETag / Last-Modified, so a 304 costs no body. Any PUT/POST/DELETE drops every
+    cached entry under the same top-level resource (a PUT to cloud/group/1 drops cloud/group and
+    cloud/group/name).
+    """
+
+    # The catalog endpoints that get re-downloaded over and over within one run
+    default_ttls = {
+        "compliance": 300,
+        "cloud/group": 300,
+        "cloud/group/name": 300,
+        "policy/compliance": 300,
+        "report": 300,
+        "filter/alert/suggest": 3600,
+    }
+
+    def __init__(self, ttls=None, maxsize=256):
+        self.ttls = dict(self.default_ttls) if ttls is None else dict(ttls)
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __repr__(self):
+        return(f"<RedLockResponseCache {len(self.entries)}/{self.maxsize} hits={self.hits} misses={self.misses}>")
+
+    def __len__(self):
+        return(len(self.entries))
+
+    def ttl(self, path):
+        '''TTL in seconds for this path, 0 means not cached'''
+        path = normalize_path(path)
+        if path in self.ttls:
+            return(self.ttls[path])
+        for pattern, ttl in self.ttls.items():
+            if fnmatch.fnmatchcase(path, pattern):
+                return(ttl)
+        return(0)
+
+    def lookup(self, path, params=None):
+        '''Returns (entry, fresh). entry is None on a miss; a stale entry can still be revalidated.
+        Paths that are never cached aren't counted as misses'''
+        if self.ttl(path) <= 0:
+            return(None, False)
+        key = cache_key(path, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return(None, False)
+            self.entries.move_to_end(key)
+            if entry.expires > time.monotonic():
+                self.hits += 1
+                return(entry, True)
+            if not entry.validators():
+                # Stale and nothing to revalidate with
+                del self.entries[key]
+                self.misses += 1
+                return(None, False)
+            return(entry, False)
+
+    def store(self, path, params, response):
+        '''Remember a 200 response if the path has a TTL'''
+        ttl = self.ttl(path)
+        if ttl <= 0:
+            return
+        key = cache_key(path, params)
+        with self.lock:
+            self.entries[key] = RedLockCacheEntry(response, ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def revalidated(self, entry):
+        '''The server answered 304: the cached response is good for another TTL'''
+        with self.lock:
+            entry.expires = time.monotonic() + entry.ttl
+            self.revalidations += 1
+
+    def invalidate(self, path):
+        '''Drop every cached entry under the same top-level resource as path'''
+        resource = top_level_resource(path)
+        with self.lock:
+            for key in [k for k in self.entries if top_level_resource(k[0]) == resource]:
+                del self.entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return({
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        })
+
+
+class RedLockCacheEntry(object):
+    """One cached response plus the validators needed for a conditional GET"""
+
+    __slots__ = ("response", "ttl", "expires", "etag", "last_modified")
+
+    def __init__(self, response, ttl):
+        self.response = response
+        self.ttl = ttl
+        self.expires = time.monotonic() + ttl
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+
+    def validators(self):
+        '''Conditional request headers for revalidating this entry'''
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return(headers)
+
+
+def normalize_path(path):
+    '''cloud/group/ and cloud/group are the same resource'''
+    return(path.strip("/"))
+
+
+def cache_key(path, params=None):
+    if params is None:
+        return((normalize_path(path), ()))
+    items = params.items() if isinstance(params, dict) else params
+    return((normalize_path(path), tuple(sorted((str(k), str(v)) for k, v in items))))
+
+
+def top_level_resource(path):
+    '''v2/alert/... -> alert, cloud/group/1 -> cloud'''
+    parts = normalize_path(path).split("/")
+    if parts[0] == "v2" and len(parts) > 1:
+        return(parts[1])
+    return(parts[0])
@@ -0,0 +1,122 @@
+import json
+
+import logging
+logger = logging.getLogger()
+
+
+class RedLockCodec(object):
+    """
+    JSON encode/decode used for request bodies, response bodies and snapshot files.
+    This one is the stdlib json module; the subclasses wrap faster optional libraries.
+    Use get_codec() to pick the fastest one installed.
+    """
+
+    name = "json"
+
+    def __repr__(self):
+        return(f"<{self.__class__.__name__} {self.name}>")
+
+    def dumps(self, obj):
+        '''Compact encoding for request bodies. Returns bytes'''
+        return(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+    def loads(self, data):
+        '''Decode bytes or str'''
+        return(json.loads(data))
+
+    def dumps_snapshot(self, obj):
+        '''Stable, human readable encoding for files: sorted keys, indent of 2. Returns bytes'''
+        return(json.dumps(obj, sort_keys=True, indent=2).encode("utf-8"))
+
+    def write_snapshot(self, file, obj):
+        '''Write obj to a binary file object with dumps_snapshot()'''
+        file.write(self.dumps_snapshot(obj))
+
+
+class RedLockOrjsonCodec(RedLockCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.snapshot_options = orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj):
+        return(self.orjson.dumps(obj, option=self.orjson.OPT_NON_STR_KEYS))
+
+    def loads(self, data):
+        return(self.orjson.loads(data))
+
+    def dumps_snapshot(self, obj):
+        return(self.orjson.dumps(obj, option=self.snapshot_options))
+
+
+class RedLockMsgspecCodec(RedLockCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self.msgspec = msgspec
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+        try:
+            self.sorted_encoder = msgspec.json.Encoder(order="sorted")
+        except TypeError:
+            # msgspec < 0.18 can't sort keys, let the stdlib write snapshots
+            self.sorted_encoder = None
+
+    def dumps(self, obj):
+        return(self.encoder.encode(obj))
+
+    def loads(self, data):
+        return(self.decoder.decode(data))
+
+    def dumps_snapshot(self, obj):
+        if self.sorted_encoder is None:
+            return(super().dumps_snapshot(obj))
+        return(self.msgspec.json.format(self.sorted_encoder.encode(obj), indent=2))
+
+
+class RedLockUjsonCodec(RedLockCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, obj):
+        return(self.ujson.dumps(obj, escape_forward_slashes=False).encode("utf-8"))
+
+    def loads(self, data):
+        return(self.ujson.loads(data))
+
+    def dumps_snapshot(self, obj):
+        return(self.ujson.dumps(obj, sort_keys=True, indent=2, escape_forward_slashes=False).encode("utf-8"))
+
+
+# Fastest first
+codecs = [RedLockOrjsonCodec, RedLockMsgspecCodec, RedLockUjsonCodec, RedLockCodec]
+
+
+def available_codecs():
+    '''One instance of every codec whose library is installed'''
+    output = []
+    for cls in codecs:
+        try:
+            output.append(cls())
+        except ImportError:
+            pass
+    return(output)
+
+
+def get_codec(name=None):
+    '''Return the named codec ("orjson", "msgspec", "ujson", "json"), or the fastest installed one'''
+    for cls in codecs:
+        if name is not None and cls.name != name:
+            continue
+        try:
+            return(cls())
+        except ImportError:
+            if name is not None:
+                raise
+    raise ValueError(f"Unknown JSON codec: {name}")
@@ -0,0 +1,253 @@
+import os
+
+import logging
+logger = logging.getLogger()
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from redlock_sdk import alerts
+from redlock_sdk.records import RedLockRecord
+
+
+# Column kinds. DICTIONARY is for ids and enums that repeat from row to row: they are stored once
+# per batch and referenced by index. TIMESTAMP columns hold epoch milliseconds.
+STRING = "string"
+DICTIONARY = "dictionary"
+INT = "int"
+BOOL = "bool"
+TIMESTAMP = "timestamp"
+DICTIONARY_LIST = "dictionary_list"
+
+
+def arrow_type(kind):
+    if kind == STRING:
+        return(pyarrow.string())
+    if kind == DICTIONARY:
+        return(pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))
+    if kind == INT:
+        return(pyarrow.int64())
+    if kind == BOOL:
+        return(pyarrow.bool_())
+    if kind == TIMESTAMP:
+        return(pyarrow.timestamp("ms", tz="UTC"))
+    if kind == DICTIONARY_LIST:
+        return(pyarrow.list_(pyarrow.dictionary(pyarrow.int32(), pyarrow.string())))
+    raise ValueError(f"Unknown column kind {kind!r}")
+
+
+def path_getter(path):
+    '''Reader for a "dotted.json.path"'''
+    keys = path.split(".")
+    def get(entry):
+        for key in keys:
+            if not isinstance(entry, dict):
+                return(None)
+            entry = entry.get(key)
+        return(entry)
+    return(get)
+
+
+def compliance_standards(alert):
+    '''The distinct standard names of an alert's policy'''
+    metadata = (alert.get('policy') or {}).get('complianceMetadata') or []
+    return(list(dict.fromkeys(c.get('standardName') for c in metadata if c.get('standardName'))))
+
+
+def compliance_sections(alert):
+    '''"standardName/requirementId/sectionId" for every section of an alert's policy'''
+    metadata = (alert.get('policy') or {}).get('complianceMetadata') or []
+    return(list(dict.fromkeys(f"{c.get('standardName')}/{c.get('requirementId')}/{c.get('sectionId')}" for c in metadata)))
+
+
+class RedLockExportTable(object):
+    """
+    A fixed column layout for one kind of listing entry.
+
+    columns are (column name, "dotted.json.path" or a function of the entry, kind). Values that
+    don't fit the column kind become nulls instead of failing the export.
+    """
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = [(column, path_getter(get) if isinstance(get, str) else get, kind) for column, get, kind in columns]
+
+    def __repr__(self):
+        return(f"<RedLockExportTable {self.name}>")
+
+    @property
+    def schema(self):
+        if pyarrow is None:
+            raise ImportError("Parquet export requires pyarrow. pip install pyarrow")
+        return(pyarrow.schema([(column, arrow_type(kind)) for column, get, kind in self.columns]))
+
+
+alert_table = RedLockExportTable("alerts", [
+    ("id", "id", STRING),
+    ("status", "status", DICTIONARY),
+    ("reason", "reason", DICTIONARY),
+    ("alertTime", "alertTime", TIMESTAMP),
+    ("firstSeen", "firstSeen", TIMESTAMP),
+    ("lastSeen", "lastSeen", TIMESTAMP),
+    ("lastUpdated", "lastUpdated", TIMESTAMP),
+    ("policyId", lambda a: a.get('policyId') or (a.get('policy') or {}).get('policyId'), DICTIONARY),
+    ("policyName", "policy.name", DICTIONARY),
+    ("policyType", "policy.policyType", DICTIONARY),
+    ("severity", "policy.severity", DICTIONARY),
+    ("accountId", "resource.accountId", DICTIONARY),
+    ("accountName", "resource.account", DICTIONARY),
+    ("cloudType", "resource.cloudType", DICTIONARY),
+    ("region", "resource.region", DICTIONARY),
+    ("resourceType", "resource.resourceType", DICTIONARY),
+    ("resourceId", "resource.id", STRING),
+    ("resourceName", "resource.name", STRING),
+    ("rrn", "resource.rrn", STRING),
+    ("standards", compliance_standards, DICTIONARY_LIST),
+    ("sections", compliance_sections, DICTIONARY_LIST),
+])
+
+policy_table = RedLockExportTable("policies", [
+    ("policyId", "policyId", STRING),
+    ("name", "name", STRING),
+    ("policyType", "policyType", DICTIONARY),
+    ("severity", "severity", DICTIONARY),
+    ("cloudType", "cloudType", DICTIONARY),
+    ("enabled", "enabled", BOOL),
+    ("systemDefault", "systemDefault", BOOL),
+    ("labels", "labels", DICTIONARY_LIST),
+    ("lastModifiedOn", "lastModifiedOn", TIMESTAMP),
+    ("lastModifiedBy", "lastModifiedBy", DICTIONARY),
+    ("openAlertsCount", "openAlertsCount", INT),
+    ("description", "description", STRING),
+    ("recommendation", "recommendation", STRING),
+    ("standards", lambda p: list(dict.fromkeys(c.get('standardName') for c in p.get('complianceMetadata') or [])), DICTIONARY_LIST),
+])
+
+account_table = RedLockExportTable("cloud_accounts", [
+    ("accountId", "accountId", STRING),
+    ("name", "name", STRING),
+    ("cloudType", "cloudType", DICTIONARY),
+    ("accountType", "accountType", DICTIONARY),
+    ("enabled", "enabled", BOOL),
+    ("status", "status", DICTIONARY),
+    ("protectionMode", "protectionMode", DICTIONARY),
+    ("numberOfChildAccounts", "numberOfChildAccounts", INT),
+    ("groupIds", "groupIds", DICTIONARY_LIST),
+    ("lastModifiedTime", "lastModifiedTime", TIMESTAMP),
+    ("lastModifiedBy", "lastModifiedBy", DICTIONARY),
+    ("addedOn", "addedOn", TIMESTAMP),
+])
+
+group_table = RedLockExportTable("cloud_account_groups", [
+    ("id", "id", STRING),
+    ("name", "name", STRING),
+    ("description", "description", STRING),
+    ("accountIds", lambda g: [str(a.get('id')) for a in g.get('accounts') or []], DICTIONARY_LIST),
+    ("lastModifiedTime", "lastModifiedTime", TIMESTAMP),
+    ("lastModifiedBy", "lastModifiedBy", DICTIONARY),
+])
+
+
+def clean(value, kind):
+    '''value if it fits the column kind, else None'''
+    if value is None:
+        return(None)
+    if kind in (STRING, DICTIONARY):
+        return(value if isinstance(value, str) else str(value) if isinstance(value, (int, float)) else None)
+    if kind in (INT, TIMESTAMP):
+        return(value if isinstance(value, int) and not isinstance(value, bool) else None)
+    if kind == BOOL:
+        return(value if isinstance(value, bool) else None)
+    if kind == DICTIONARY_LIST:
+        if not isinstance(value, (list, tuple)):
+            return(None)
+        return([str(v) for v in value if v is not None])
+    return(value)
+
+
+def record_batches(table, entries, batch_size=10000):
+    '''Stream entries (dicts, or records.RedLockRecord) as pyarrow.RecordBatch of at most batch_size rows'''
+    schema = table.schema
+    columns = [[] for c in table.columns]
+    rows = 0
+    for entry in entries:
+        if isinstance(entry, RedLockRecord):
+            entry = entry.to_json()
+        for values, (column, get, kind) in zip(columns, table.columns):
+            values.append(clean(get(entry), kind))
+        rows += 1
+        if rows >= batch_size:
+            yield(pyarrow.RecordBatch.from_arrays([pyarrow.array(v, type=f.type) for v, f in zip(columns, schema)], schema=schema))
+            columns = [[] for c in table.columns]
+            rows = 0
+    if rows:
+        yield(pyarrow.RecordBatch.from_arrays([pyarrow.array(v, type=f.type) for v, f in zip(columns, schema)], schema=schema))
+
+
+class RedLockParquetWriter(object):
+    """
+    Writes listing entries to a Parquet file with a fixed schema, one row group per batch.
+
+        with export.RedLockParquetWriter("alerts.parquet", export.alert_table) as writer:
+            writer.write_all(alerts.RedLockAlertQuery(rl_api, querystring))
+
+    Only the current batch is held in memory, so any number of alerts can be exported.
+    Requires pyarrow.
+    """
+
+    batch_size = 10000
+
+    def __init__(self, path, table, batch_size=None, compression="snappy"):
+        if pyarrow is None:
+            raise ImportError("Parquet export requires pyarrow. pip install pyarrow")
+        self.path = path
+        self.table = table
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.rows = 0
+        self.writer = pyarrow.parquet.ParquetWriter(path, table.schema, compression=compression)
+
+    def __repr__(self):
+        return(f"<RedLockParquetWriter {self.table.name} {self.path}>")
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return(False)
+
+    def write_all(self, entries):
+        '''Write every entry of an iterable. Returns the number of rows written'''
+        count = 0
+        for batch in record_batches(self.table, entries, self.batch_size):
+            self.writer.write_batch(batch)
+            count += batch.num_rows
+        self.rows += count
+        return(count)
+
+    def close(self):
+        self.writer.close()
+
+
+def export_parquet(api, path, querystring=None, batch_size=None, compression="snappy"):
+    '''Export cloud accounts, account groups, policies and the alerts matching querystring (default:
+    all of them) to <path>/<table>.parquet. Returns {table name: rows}'''
+    if querystring is None:
+        querystring = {"timeType": "to_now", "timeUnit": "epoch", "detailed": False}
+    sources = [
+        (account_table, lambda: api.get_json("cloud")),
+        (group_table, lambda: api.get_json("cloud/group")),
+        (policy_table, lambda: api.get_json("policy")),
+        (alert_table, lambda: alerts.iter_alerts(api, querystring)),
+    ]
+    output = {}
+    for table, entries in sources:
+        filename = os.path.join(path, f"{table.name}.parquet")
+        with RedLockParquetWriter(filename, table, batch_size=batch_size, compression=compression) as writer:
+            output[table.name] = writer.write_all(entries())
+        logger.debug(f"Exported {output[table.name]} {table.name} to {filename}")
+    return(output)
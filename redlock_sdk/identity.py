@@ -0,0 +1,118 @@
+import inspect
+import threading
+import weakref
+
+import logging
+logger = logging.getLogger()
+
+
+class RedLockIdentityMap(object):
+    """
+    One object per RedLock entity for a client: (entity type, id) -> the model object already built.
+
+    RedLockAPI keeps one of these as api.identity_map. Constructing an account, group, standard,
+    policy or report that is already in the map returns the existing object instead of fetching
+    and building a duplicate. Entries are weak references, so an object leaves the map as soon as
+    callers drop it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = weakref.WeakValueDictionary()
+
+    def __repr__(self):
+        return(f"<RedLockIdentityMap {len(self)} objects>")
+
+    def __len__(self):
+        return(len(self.objects))
+
+    def __contains__(self, key):
+        return(key in self.objects)
+
+    def get(self, entity_type, entity_id):
+        '''The live object for (entity_type, entity_id), or None'''
+        with self.lock:
+            return(self.objects.get((entity_type, entity_id)))
+
+    def add(self, entity_type, entity_id, obj):
+        '''Map (entity_type, entity_id) to obj. If another thread got there first, its object
+        wins and is returned, otherwise obj is'''
+        with self.lock:
+            return(self.objects.setdefault((entity_type, entity_id), obj))
+
+    def discard(self, entity_type, entity_id):
+        with self.lock:
+            self.objects.pop((entity_type, entity_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.objects.clear()
+
+
+class RedLockIdentityMeta(type):
+    """
+    Routes constructor calls through the client's identity map. The entity id is the first
+    argument after the api (or the keyword named by identity_arg). When the object already
+    exists, the constructor arguments named in identity_attachments (eg a group's registry) that
+    aren't None are set on it, the others are ignored.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        api = args[0] if args else kwargs.get("api")
+        identity_map = getattr(api, "identity_map", None)
+        if identity_map is None or cls.identity_type is None:
+            return(super().__call__(*args, **kwargs))
+
+        entity_id = args[1] if len(args) > 1 else kwargs.get(cls.identity_arg)
+        obj = identity_map.get(cls.identity_type, entity_id)
+        if obj is None:
+            # Built outside the lock: two threads may race, the first one to register wins
+            built = super().__call__(*args, **kwargs)
+            obj = identity_map.add(cls.identity_type, entity_id, built)
+            if obj is not built:
+                cls.__attach__(obj, args, kwargs)
+            return(obj)
+
+        cls.__attach__(obj, args, kwargs)
+        # An eager constructor call on an object that is still lazy loads it
+        if not kwargs.get("lazy", False) and not obj.__dict__.get("_loaded", True):
+            obj.load()
+        return(obj)
+
+    def __attach__(cls, obj, args, kwargs):
+        '''Set the identity_attachments passed to a constructor call on the existing object'''
+        if not cls.identity_attachments:
+            return
+        arguments = inspect.signature(cls.__init__).bind_partial(obj, *args, **kwargs).arguments
+        for name in cls.identity_attachments:
+            if arguments.get(name) is not None:
+                setattr(obj, name, arguments[name])
+
+
+class RedLockIdentityMixin(object, metaclass=RedLockIdentityMeta):
+    """
+    Model classes set identity_type (eg "cloud/aws", "policy") and identity_arg (the name of
+    their id constructor argument) to be de-duplicated through api.identity_map.
+    """
+
+    identity_type = None
+    identity_arg = None
+    # Constructor arguments that aren't part of the identity but still apply to an existing object
+    identity_attachments = ()
+
+    @classmethod
+    def __identity__(cls, api, entity_id):
+        '''The object already built for entity_id on this api, or None'''
+        identity_map = getattr(api, "identity_map", None)
+        if identity_map is None or cls.identity_type is None:
+            return(None)
+        return(identity_map.get(cls.identity_type, entity_id))
+
+    @classmethod
+    def __register__(cls, api, entity_id, obj):
+        '''Put an object built without the constructor (eg by from_data) in the identity map.
+        Returns the object to use'''
+        identity_map = getattr(api, "identity_map", None)
+        if identity_map is None or cls.identity_type is None:
+            return(obj)
+        return(identity_map.add(cls.identity_type, entity_id, obj))
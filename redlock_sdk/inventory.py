@@ -0,0 +1,257 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import logging
+logger = logging.getLogger()
+
+
+def flatten_compliance(payload):
+    '''policy/compliance is {standardName: [entries]}, turn it into one list of entries'''
+    output = []
+    for standard_name, entries in payload.items():
+        output.extend(entries)
+    return(output)
+
+
+class RedLockInventorySource(object):
+    """One listing endpoint kept in the inventory, and where its rows keep their id, name and cloud type"""
+
+    def __init__(self, kind, path, id_key, name_key="name", cloud_type_key="cloudType", items=None):
+        self.kind = kind
+        self.path = path
+        self.id_key = id_key
+        self.name_key = name_key
+        self.cloud_type_key = cloud_type_key
+        self.items = items or (lambda payload: payload)
+
+    def __repr__(self):
+        return(f"<RedLockInventorySource {self.kind} {self.path}>")
+
+    def row(self, entry):
+        '''(id, name, cloud_type) for one listing entry'''
+        cloud_type = entry.get(self.cloud_type_key) if self.cloud_type_key else None
+        if not isinstance(cloud_type, str):
+            # Standards list several cloud types
+            cloud_type = None
+        return(str(entry[self.id_key]), entry.get(self.name_key), cloud_type)
+
+
+default_sources = [
+    RedLockInventorySource("account", "cloud", "accountId"),
+    RedLockInventorySource("group", "cloud/group", "id", cloud_type_key=None),
+    RedLockInventorySource("policy", "policy", "policyId"),
+    RedLockInventorySource("compliance", "policy/compliance", "complianceId", name_key="standardName",
+                           cloud_type_key=None, items=flatten_compliance),
+    RedLockInventorySource("standard", "compliance", "id"),
+    RedLockInventorySource("report", "report", "id"),
+]
+
+
+schema = """
+CREATE TABLE IF NOT EXISTS entity (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    cloud_type TEXT,
+    hash TEXT NOT NULL,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    deleted_at REAL,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS entity_name ON entity (kind, name);
+CREATE INDEX IF NOT EXISTS entity_cloud_type ON entity (kind, cloud_type);
+CREATE TABLE IF NOT EXISTS membership (
+    group_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    cloud_type TEXT,
+    PRIMARY KEY (group_id, account_id)
+);
+CREATE INDEX IF NOT EXISTS membership_account ON membership (account_id);
+CREATE TABLE IF NOT EXISTS refresh (
+    kind TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+"""
+
+
+class RedLockInventory(object):
+    """
+    The tenant's catalog (accounts, account groups, policies, compliance metadata, standards and
+    reports) persisted in a local SQLite database, so jobs don't start cold.
+
+        inventory = inventory.RedLockInventory(rl_api, "redlock.db")
+        inventory.refresh(max_age=3600)  # only re-lists what is older than an hour
+        inventory.find("account", cloud_type="aws")
+        group = account.RedLockAccountGroup.from_inventory(inventory, "prod")
+
+    refresh() is incremental: rows whose content changed are upserted, rows gone from the
+    listing are tombstoned (deleted_at is set, they are hidden from queries unless asked for).
+    Query results are the raw listing dicts. The model classes' from_inventory() build objects.
+    """
+
+    def __init__(self, api, path=":memory:", sources=None):
+        self.api = api
+        self.path = path
+        self.sources = {s.kind: s for s in (sources or default_sources)}
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(schema)
+
+    def __repr__(self):
+        return(f"<RedLockInventory {self.path}>")
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return(False)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def dumps(self, entry):
+        codec = getattr(self.api, "codec", None)
+        return(codec.dumps(entry) if codec is not None else json.dumps(entry).encode("utf-8"))
+
+    def loads(self, data):
+        codec = getattr(self.api, "codec", None)
+        return(codec.loads(data) if codec is not None else json.loads(data))
+
+    def refreshed_at(self, kind):
+        '''When kind was last refreshed (epoch seconds), or None'''
+        with self.lock:
+            row = self.db.execute("SELECT refreshed_at FROM refresh WHERE kind = ?", (kind,)).fetchone()
+        return(row[0] if row else None)
+
+    def refresh(self, kinds=None, max_age=None, max_workers=None):
+        '''Re-list kinds (default all) and apply the differences. With max_age (seconds) kinds
+        refreshed more recently than that are skipped. The listings are fetched concurrently.
+        Returns {kind: {"added": n, "changed": n, "removed": n, "unchanged": n}}'''
+        now = time.time()
+        kinds = list(kinds or self.sources)
+        if max_age is not None:
+            kinds = [k for k in kinds if (self.refreshed_at(k) or 0) < now - max_age]
+        if not kinds:
+            return({})
+
+        responses = self.api.map_get([self.sources[k].path for k in kinds], max_workers=max_workers)
+        summary = {}
+        for kind, response in zip(kinds, responses):
+            if isinstance(response, Exception):
+                raise response
+            summary[kind] = self.apply(kind, self.sources[kind].items(self.loads(response.content)), now)
+        return(summary)
+
+    def apply(self, kind, entries, now=None):
+        '''Sync one kind to a complete listing: upsert what changed, tombstone what is gone'''
+        source = self.sources[kind]
+        now = now or time.time()
+        counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+
+        with self.lock, self.db:
+            known = {row[0]: (row[1], row[2]) for row in
+                     self.db.execute("SELECT id, hash, deleted_at FROM entity WHERE kind = ?", (kind,))}
+            seen = set()
+            for entry in entries:
+                entity_id, name, cloud_type = source.row(entry)
+                seen.add(entity_id)
+                digest = hashlib.sha1(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+                previous = known.get(entity_id)
+                if previous is not None and previous[0] == digest and previous[1] is None:
+                    counts['unchanged'] += 1
+                    continue
+                counts['added' if previous is None or previous[1] is not None else 'changed'] += 1
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entity (kind, id, name, cloud_type, hash, data, updated_at, deleted_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                    (kind, entity_id, name, cloud_type, digest, self.dumps(entry), now))
+                if kind == "group":
+                    self.__set_members__(entity_id, entry.get('accounts') or [])
+
+            for entity_id, (digest, deleted_at) in known.items():
+                if entity_id not in seen and deleted_at is None:
+                    counts['removed'] += 1
+                    self.db.execute("UPDATE entity SET deleted_at = ? WHERE kind = ? AND id = ?", (now, kind, entity_id))
+                    if kind == "group":
+                        self.__set_members__(entity_id, [])
+
+            self.db.execute("INSERT OR REPLACE INTO refresh (kind, refreshed_at) VALUES (?, ?)", (kind, now))
+        logger.debug(f"Inventory {kind}: {counts}")
+        return(counts)
+
+    def __set_members__(self, group_id, accounts):
+        self.db.execute("DELETE FROM membership WHERE group_id = ?", (group_id,))
+        self.db.executemany("INSERT OR REPLACE INTO membership (group_id, account_id, cloud_type) VALUES (?, ?, ?)",
+                            [(group_id, str(a['id']), a.get('type')) for a in accounts])
+
+    def __query__(self, sql, args):
+        with self.lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return([self.loads(row[0]) for row in rows])
+
+    def get(self, kind, entity_id, include_deleted=False):
+        '''The listing entry for one id, or None'''
+        sql = "SELECT data FROM entity WHERE kind = ? AND id = ?"
+        if not include_deleted:
+            sql += " AND deleted_at IS NULL"
+        rows = self.__query__(sql, (kind, str(entity_id)))
+        return(rows[0] if rows else None)
+
+    def lookup(self, kind, id_or_name):
+        '''The entry with this id, else the first one with this name, else None'''
+        entry = self.get(kind, id_or_name)
+        if entry is None:
+            found = self.find(kind, name=id_or_name)
+            entry = found[0] if found else None
+        return(entry)
+
+    def find(self, kind, name=None, cloud_type=None, include_deleted=False):
+        '''Entries of kind, optionally filtered by exact name and/or cloud type'''
+        sql = "SELECT data FROM entity WHERE kind = ?"
+        args = [kind]
+        if name is not None:
+            sql += " AND name = ?"
+            args.append(name)
+        if cloud_type is not None:
+            sql += " AND cloud_type = ?"
+            args.append(cloud_type)
+        if not include_deleted:
+            sql += " AND deleted_at IS NULL"
+        return(self.__query__(sql + " ORDER BY name", args))
+
+    def group_members(self, group_id, cloud_type=None):
+        '''Account entries that are members of the account group with this id'''
+        sql = ("SELECT e.data FROM membership m JOIN entity e ON e.kind = 'account' AND e.id = m.account_id "
+               "WHERE m.group_id = ? AND e.deleted_at IS NULL")
+        args = [group_id]
+        if cloud_type is not None:
+            sql += " AND m.cloud_type = ?"
+            args.append(cloud_type)
+        return(self.__query__(sql + " ORDER BY e.name", args))
+
+    def account_groups(self, account_id):
+        '''Group entries the account with this id belongs to'''
+        sql = ("SELECT e.data FROM membership m JOIN entity e ON e.kind = 'group' AND e.id = m.group_id "
+               "WHERE m.account_id = ? AND e.deleted_at IS NULL ORDER BY e.name")
+        return(self.__query__(sql, (str(account_id),)))
+
+    def tombstones(self, kind, since=None):
+        '''(id, deleted_at) of the entries of kind removed (since an epoch time, if given)'''
+        sql = "SELECT id, deleted_at FROM entity WHERE kind = ? AND deleted_at IS NOT NULL"
+        args = [kind]
+        if since is not None:
+            sql += " AND deleted_at >= ?"
+            args.append(since)
+        with self.lock:
+            return(self.db.execute(sql, args).fetchall())
+
+    def purge(self, older_than):
+        '''Forget tombstones older than older_than seconds'''
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entity WHERE deleted_at IS NOT NULL AND deleted_at < ?", (time.time() - older_than,))
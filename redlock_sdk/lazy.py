@@ -0,0 +1,73 @@
+import logging
+logger = logging.getLogger()
+
+
+class RedLockLazyMixin(object):
+    """
+    Lets a model class be constructed with lazy=True: the constructor only records the identifier,
+    and the first access of an attribute that isn't there yet calls __load__() (normally get()).
+
+    Objects that were filled from a listing that lacks some fields (eg accounts built by
+    load_accounts()) stay unloaded as well, so asking for a field the listing didn't have
+    fetches the full record once.
+
+    Classes define __prefetch__(api, objects) to fill many unloaded objects in one batch.
+    See prefetch().
+    """
+
+    # Instances only carry _loaded = False while they are waiting for their data
+    _loaded = True
+
+    def __getattr__(self, name):
+        # Only called for attributes that don't exist. Never load for private/dunder lookups
+        # (copy, pickle, hasattr checks in __init__...)
+        if name.startswith("_") or self.__dict__.get("_loaded", True):
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        self.load()
+        return(getattr(self, name))
+
+    def load(self):
+        '''Fetch this object's data now if it hasn't been yet'''
+        if self.__dict__.get("_loaded", True):
+            return
+        self._loaded = True
+        try:
+            self.__load__()
+        except Exception:
+            self._loaded = False
+            raise
+
+    def __load__(self):
+        '''Fetch this object's data from the API'''
+        self.get()
+
+    @property
+    def loaded(self):
+        return(self.__dict__.get("_loaded", True))
+
+
+def prefetch(objects, max_workers=None):
+    '''Load many lazy objects with as few requests as possible. Objects are grouped by the
+    __prefetch__ implementation of their class and by client, and each group is filled in one batch
+    (one listing, or concurrent detail fetches). Returns the objects.'''
+    objects = list(objects)
+    batches = {}
+    for obj in objects:
+        if obj.__dict__.get("_loaded", True):
+            continue
+        # Objects of different clients (tenants, credentials) never share a fetch
+        key = (type(obj).__prefetch__.__func__, id(obj.__dict__.get("api")))
+        batches.setdefault(key, (type(obj), []))[1].append(obj)
+
+    for cls, batch in batches.values():
+        logger.debug(f"Prefetching {len(batch)} {cls.__name__}")
+        # Marked loaded first: __prefetch__ may leave some objects partial (eg from a listing)
+        for obj in batch:
+            obj._loaded = True
+        try:
+            cls.__prefetch__(batch[0].api, batch, max_workers=max_workers)
+        except Exception:
+            for obj in batch:
+                obj._loaded = False
+            raise
+    return(objects)
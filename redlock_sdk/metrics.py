@@ -0,0 +1,187 @@
+import re
+import json
+import bisect
+import threading
+import collections
+
+import logging
+logger = logging.getLogger()
+
+
+# Concrete paths are folded into these templates so ids don't explode the number of series.
+# First match wins.
+endpoint_templates = [
+    (re.compile(r"^cloud/group/name$"), "cloud/group/name"),
+    (re.compile(r"^cloud/group/[^/]+$"), "cloud/group/{id}"),
+    (re.compile(r"^cloud/(aws|azure|gcp|alibaba_cloud)/[^/]+/project$"), "cloud/{type}/{id}/project"),
+    (re.compile(r"^cloud/(aws|azure|gcp|alibaba_cloud)/[^/]+$"), "cloud/{type}/{id}"),
+    (re.compile(r"^compliance/requirement/section/[^/]+$"), "compliance/requirement/section/{id}"),
+    (re.compile(r"^compliance/requirement/[^/]+$"), "compliance/requirement/{id}"),
+    (re.compile(r"^compliance/[^/]+/requirement$"), "compliance/{id}/requirement"),
+    (re.compile(r"^compliance/[^/]+/section$"), "compliance/{id}/section"),
+    (re.compile(r"^compliance/(?!requirement$)[^/]+$"), "compliance/{id}"),
+    (re.compile(r"^policy/(?!compliance$)[^/]+$"), "policy/{id}"),
+    (re.compile(r"^report/[^/]+/download$"), "report/{id}/download"),
+    (re.compile(r"^report/[^/]+$"), "report/{id}"),
+]
+
+
+def endpoint_template(path):
+    '''cloud/aws/123456789012 -> cloud/{type}/{id}'''
+    path = path.strip("/")
+    for regex, template in endpoint_templates:
+        if regex.match(path):
+            return(template)
+    return(path)
+
+
+class RedLockMetrics(object):
+    """
+    Per endpoint request metrics for a RedLockAPI built with metrics=RedLockMetrics().
+    Keyed by (method, endpoint template): request count, status codes, a latency histogram,
+    request/response bytes, retries and cache hits.
+
+    hooks are called with a dict describing every request, exporters are called with this object
+    by export(). prometheus_exporter() and json_exporter() build file writing exporters.
+    When a client has no metrics object the only cost is one attribute check per request.
+    """
+
+    # Latency histogram bucket upper bounds, in seconds
+    buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, hooks=None, exporters=None):
+        self.hooks = list(hooks or [])
+        self.exporters = list(exporters or [])
+        self.lock = threading.Lock()
+        self.endpoints = collections.OrderedDict()
+
+    def __repr__(self):
+        return(f"<RedLockMetrics {len(self.endpoints)} endpoints, {sum(e.requests for e in self.endpoints.values())} requests>")
+
+    def __stats__(self, method, path):
+        key = (method, endpoint_template(path))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = RedLockEndpointStats(len(self.buckets))
+        return(stats)
+
+    def record(self, method, path, status, elapsed, request_bytes=0, response_bytes=0, retries=0):
+        '''Record one completed request (including any retries it took)'''
+        with self.lock:
+            stats = self.__stats__(method, path)
+            stats.requests += 1
+            stats.statuses[status] += 1
+            stats.latency_sum += elapsed
+            stats.latency_buckets[bisect.bisect_left(self.buckets, elapsed)] += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.retries += retries
+        for hook in self.hooks:
+            hook({"method": method, "path": path, "endpoint": endpoint_template(path), "status": status,
+                  "elapsed": elapsed, "request_bytes": request_bytes, "response_bytes": response_bytes,
+                  "retries": retries, "cache_hit": False})
+
+    def record_cache_hit(self, method, path):
+        '''Record a request answered from the response cache (including 304 revalidations)'''
+        with self.lock:
+            self.__stats__(method, path).cache_hits += 1
+        for hook in self.hooks:
+            hook({"method": method, "path": path, "endpoint": endpoint_template(path), "cache_hit": True})
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def summary(self):
+        '''Plain dict of everything recorded, slowest endpoints (by total time) first'''
+        with self.lock:
+            output = []
+            for (method, endpoint), stats in self.endpoints.items():
+                output.append({
+                    "method": method,
+                    "endpoint": endpoint,
+                    "requests": stats.requests,
+                    "statuses": {str(k): v for k, v in stats.statuses.items()},
+                    "latency_total": stats.latency_sum,
+                    "latency_mean": stats.latency_sum / stats.requests if stats.requests else 0.0,
+                    "latency_buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], stats.latency_buckets)),
+                    "request_bytes": stats.request_bytes,
+                    "response_bytes": stats.response_bytes,
+                    "retries": stats.retries,
+                    "cache_hits": stats.cache_hits,
+                })
+        return(sorted(output, key=lambda e: e["latency_total"], reverse=True))
+
+    def json_summary(self, **kwargs):
+        return(json.dumps(self.summary(), **kwargs))
+
+    def prometheus_text(self):
+        '''Prometheus text exposition format'''
+        lines = []
+        with self.lock:
+            items = list(self.endpoints.items())
+
+            lines.append("# TYPE redlock_requests_total counter")
+            for (method, endpoint), stats in items:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'redlock_requests_total{{{labels(method, endpoint)},status="{status}"}} {count}')
+
+            lines.append("# TYPE redlock_request_duration_seconds histogram")
+            for (method, endpoint), stats in items:
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ["+Inf"], stats.latency_buckets):
+                    cumulative += count
+                    lines.append(f'redlock_request_duration_seconds_bucket{{{labels(method, endpoint)},le="{bound}"}} {cumulative}')
+                lines.append(f'redlock_request_duration_seconds_sum{{{labels(method, endpoint)}}} {stats.latency_sum}')
+                lines.append(f'redlock_request_duration_seconds_count{{{labels(method, endpoint)}}} {stats.requests}')
+
+            for name, attr in [("redlock_request_bytes_total", "request_bytes"),
+                               ("redlock_response_bytes_total", "response_bytes"),
+                               ("redlock_retries_total", "retries"),
+                               ("redlock_cache_hits_total", "cache_hits")]:
+                lines.append(f"# TYPE {name} counter")
+                for (method, endpoint), stats in items:
+                    lines.append(f'{name}{{{labels(method, endpoint)}}} {getattr(stats, attr)}')
+        return("\n".join(lines) + "\n")
+
+    def export(self):
+        '''Hand this object to every exporter'''
+        for exporter in self.exporters:
+            exporter(self)
+
+
+class RedLockEndpointStats(object):
+    """Counters for one (method, endpoint template)"""
+
+    __slots__ = ("requests", "statuses", "latency_sum", "latency_buckets",
+                 "request_bytes", "response_bytes", "retries", "cache_hits")
+
+    def __init__(self, bucket_count):
+        self.requests = 0
+        self.statuses = collections.Counter()
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (bucket_count + 1) # last one is +Inf
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.cache_hits = 0
+
+
+def labels(method, endpoint):
+    return(f'method="{method}",endpoint="{endpoint}"')
+
+
+def prometheus_exporter(filename):
+    '''Exporter that writes the Prometheus text dump to filename (eg for node_exporter's textfile collector)'''
+    def exporter(metrics):
+        with open(filename, "w") as f:
+            f.write(metrics.prometheus_text())
+    return(exporter)
+
+
+def json_exporter(filename):
+    '''Exporter that writes the JSON summary to filename'''
+    def exporter(metrics):
+        with open(filename, "w") as f:
+            f.write(metrics.json_summary(indent=2))
+    return(exporter)
@@ -0,0 +1,216 @@
+import logging
+logger = logging.getLogger()
+
+from redlock_sdk.alerts import RedLockAlertFanOut
+
+
+# Filters the planner can merge: how to read the filtered value back out of an alert, so merged
+# results can be split per logical query on the client. Extractors return a collection of values.
+filter_extractors = {
+    "cloud.accountId": lambda a: [(a.get('resource') or {}).get('accountId')],
+    "cloud.account": lambda a: [(a.get('resource') or {}).get('account')],
+    "cloud.type": lambda a: [(a.get('resource') or {}).get('cloudType')],
+    "cloud.region": lambda a: [(a.get('resource') or {}).get('region')],
+    "resource.type": lambda a: [(a.get('resource') or {}).get('resourceType')],
+    "alert.id": lambda a: [a.get('id')],
+    "alert.status": lambda a: [a.get('status')],
+    "policy.id": lambda a: [a.get('policyId') or (a.get('policy') or {}).get('policyId')],
+    "policy.name": lambda a: [(a.get('policy') or {}).get('name')],
+    "policy.type": lambda a: [(a.get('policy') or {}).get('policyType')],
+    "policy.severity": lambda a: [(a.get('policy') or {}).get('severity')],
+}
+
+# These are checked together against each complianceMetadata entry of the alert's policy
+compliance_filters = {
+    "policy.complianceStandard": "standardName",
+    "policy.complianceRequirement": "requirementName",
+    "policy.complianceSection": "sectionId",
+}
+
+# Tried in this order when looking for the filter a set of queries differ in
+mergeable_filters = list(filter_extractors) + list(compliance_filters)
+
+# Checking these on the client needs fields that only detailed alerts have
+detailed_filters = {"policy.name", "policy.severity"}.union(compliance_filters)
+
+
+def as_values(value):
+    '''A filter value as a tuple of strings (filters can be repeated to OR several values).
+    None values are left out, like requests leaves them out of the query string'''
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return(tuple(str(v) for v in value if v is not None))
+    if value is None:
+        return(())
+    return((str(value),))
+
+
+def split_values(alert, key):
+    '''The values of one mergeable filter an alert has, as strings'''
+    extract = filter_extractors.get(key)
+    if extract is not None:
+        return([str(v) for v in extract(alert)])
+    field = compliance_filters[key]
+    return([str(c.get(field)) for c in (alert.get('policy') or {}).get('complianceMetadata') or []])
+
+
+def matches(alert, filters):
+    '''Whether alert satisfies the filters the client can check (the mergeable ones).
+    Other filters (time range, account.group, ...) are shared by the merged request'''
+    for key, value in filters.items():
+        extract = filter_extractors.get(key)
+        values = as_values(value)
+        if extract is not None and values and not set(values).intersection(str(v) for v in extract(alert)):
+            return(False)
+
+    wanted = {field: set(as_values(filters[key])) for key, field in compliance_filters.items() if as_values(filters.get(key))}
+    if wanted:
+        for c in (alert.get('policy') or {}).get('complianceMetadata') or []:
+            if all(str(c.get(field)) in values for field, values in wanted.items()):
+                return(True)
+        return(False)
+    return(True)
+
+
+class RedLockPlannedQuery(object):
+    """One physical v2/alert request standing in for several logical queries"""
+
+    def __init__(self, filters, keys, split_on=None, queries=None):
+        self.filters = filters
+        self.keys = keys # the logical queries it answers
+        self.split_on = split_on # the merged filter, None for a query that wasn't merged
+
+        # value of split_on -> the keys asking for it
+        self.index = {}
+        if split_on is not None:
+            for key in keys:
+                for value in as_values(queries[key][split_on]):
+                    self.index.setdefault(value, []).append(key)
+
+    def route(self, alert, queries):
+        '''The keys of the logical queries alert answers'''
+        if self.split_on is None:
+            return(self.keys)
+        candidates = []
+        for value in split_values(alert, self.split_on):
+            candidates.extend(self.index.get(value, []))
+        return([key for key in dict.fromkeys(candidates) if matches(alert, queries[key])])
+
+    def __repr__(self):
+        return(f"<RedLockPlannedQuery {len(self.keys)} queries, split on {self.split_on}>")
+
+
+class RedLockAlertQueryPlanner(object):
+    """
+    Answers many small v2/alert questions with few requests.
+
+    queries maps a key to filters, typically the alert_querystring() of many accounts, policies or
+    compliance sections. Queries that are identical except for one mergeable filter (see
+    mergeable_filters) are merged into one request that repeats that filter with every value,
+    max_values at a time. When more than superset_threshold values would be merged the filter is
+    dropped altogether: one superset request is made and everything is split on the client.
+
+        planner = planner.RedLockAlertQueryPlanner(rl_api, {a.account_id: a.alert_querystring() for a in accounts})
+        results = planner.execute()   # {account_id: [alerts]}
+
+    Splitting re-checks the mergeable filters of each logical query against every alert, so the
+    alerts must carry the fields filtered on. Merged requests that filter on policy name, severity
+    or compliance (see detailed_filters) are sent with detailed=True for that reason.
+    """
+
+    # Values of one filter per merged request (keeps URLs a sane length)
+    max_values = 100
+    # Above this many values, drop the filter and split a superset query instead
+    superset_threshold = 500
+
+    def __init__(self, api, queries, max_values=None, superset_threshold=None, max_workers=None):
+        self.api = api
+        self.queries = dict(queries)
+        if max_values is not None:
+            self.max_values = max_values
+        if superset_threshold is not None:
+            self.superset_threshold = superset_threshold
+        self.max_workers = max_workers
+        self.errors = {}
+
+    def __repr__(self):
+        return(f"<RedLockAlertQueryPlanner {len(self.queries)} queries>")
+
+    @staticmethod
+    def __signature__(filters, without):
+        return(tuple(sorted((k, as_values(v)) for k, v in filters.items() if k != without and v is not None)))
+
+    def plan(self):
+        '''The physical queries that answer every logical one'''
+        planned = []
+        remaining = dict(self.queries)
+
+        # Greedy: merge on whichever filter gives the biggest groups first
+        while len(remaining) > 1:
+            best = None
+            for key in mergeable_filters:
+                buckets = {}
+                for query_key, filters in remaining.items():
+                    if as_values(filters.get(key)):
+                        buckets.setdefault(self.__signature__(filters, key), []).append(query_key)
+                for members in buckets.values():
+                    if len(members) > 1 and (best is None or len(members) > len(best[1])):
+                        best = (key, members)
+            if best is None:
+                break
+
+            key, members = best
+            planned.extend(self.__merge__(key, members))
+            for query_key in members:
+                del remaining[query_key]
+
+        for query_key, filters in remaining.items():
+            planned.append(RedLockPlannedQuery(dict(filters), [query_key]))
+        logger.debug(f"Planned {len(self.queries)} alert queries as {len(planned)} requests")
+        return(planned)
+
+    def __merge__(self, key, members):
+        base = {k: v for k, v in self.queries[members[0]].items() if k != key}
+        if detailed_filters.intersection(k for k, v in self.queries[members[0]].items() if v is not None):
+            # Results are split on fields that alerts only carry when detailed
+            base['detailed'] = True
+        values = list(dict.fromkeys(v for m in members for v in as_values(self.queries[m][key])))
+        if len(values) > self.superset_threshold:
+            return([RedLockPlannedQuery(base, members, split_on=key, queries=self.queries)])
+
+        output = []
+        for start in range(0, len(values), self.max_values):
+            chunk = set(values[start:start + self.max_values])
+            filters = dict(base)
+            filters[key] = sorted(chunk)
+            keys = [m for m in members if set(as_values(self.queries[m][key])) & chunk]
+            output.append(RedLockPlannedQuery(filters, keys, split_on=key, queries=self.queries))
+        return(output)
+
+    def execute(self, page_size=None):
+        '''Run the plan concurrently. Returns {key: [alerts]} for every logical query.
+        A logical query whose request failed gets its exception in self.errors (and an empty list).'''
+        planned = self.plan()
+        results = {key: [] for key in self.queries}
+
+        # A query whose values were spread over several requests could see an alert twice
+        requests_per_key = {}
+        for query in planned:
+            for key in query.keys:
+                requests_per_key[key] = requests_per_key.get(key, 0) + 1
+        seen = {key: set() for key, count in requests_per_key.items() if count > 1}
+
+        fan_out = RedLockAlertFanOut(self.api, {i: p.filters for i, p in enumerate(planned)},
+                                     max_workers=self.max_workers, page_size=page_size)
+        for i, alert in fan_out:
+            for key in planned[i].route(alert, self.queries):
+                if key in seen:
+                    if alert.get('id') in seen[key]:
+                        continue
+                    seen[key].add(alert.get('id'))
+                results[key].append(alert)
+
+        self.errors = {}
+        for i, error in fan_out.errors.items():
+            for key in planned[i].keys:
+                self.errors[key] = error
+        return(results)
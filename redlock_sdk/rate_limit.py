@@ -0,0 +1,149 @@
+import time
+import random
+import datetime
+import threading
+import collections
+from email.utils import parsedate_to_datetime
+
+import logging
+logger = logging.getLogger()
+
+
+class RedLockRateLimiter(object):
+    """
+    Token bucket shared by every request made through one RedLockAPI (or several, if you pass the
+    same instance to each). The refill rate adapts AIMD style: each success adds a little, each 429
+    multiplies it down and honors the server's Retry-After by pausing the whole bucket.
+
+    rate=None starts unlimited. A 429 with a Retry-After only pauses the bucket; the first 429
+    without one seeds the rate from the sustained request rate over the last window seconds
+    (never below seed_min_rate).
+    """
+
+    # Fraction of the rate kept on a 429
+    decrease_factor = 0.5
+    # Requests/second added per second of throttle free traffic
+    increase_step = 0.5
+    # How far back sustained_rate() looks, in seconds
+    window = 60
+    # Lowest rate a first 429 can seed, a sequential client is never the one flooding the API
+    seed_min_rate = 2.0
+
+    def __init__(self, rate=None, burst=None, min_rate=0.5, max_rate=None):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = self.__capacity__()
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.history = collections.deque()
+        self.throttled = 0
+
+    def __repr__(self):
+        rate = "unlimited" if self.rate is None else f"{self.rate:.2f}/s"
+        return(f"<RedLockRateLimiter {rate} sustained={self.sustained_rate():.2f}/s throttled={self.throttled}>")
+
+    def __capacity__(self):
+        if self.rate is None:
+            return(0.0)
+        if self.burst is not None:
+            return(float(self.burst))
+        return(max(1.0, self.rate))
+
+    def reserve(self):
+        '''Take a token and return how many seconds the caller must wait before sending'''
+        with self.lock:
+            now = time.monotonic()
+            self.history.append(now)
+            while self.history and self.history[0] < now - self.window:
+                self.history.popleft()
+
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate is None:
+                return(wait)
+
+            self.tokens = min(self.__capacity__(), self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return(wait)
+
+    def acquire(self):
+        '''Block until the next request may be sent'''
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        '''Additive increase'''
+        with self.lock:
+            if self.rate is None:
+                return
+            self.rate += self.increase_step / self.rate
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+
+    def on_throttle(self, retry_after=None):
+        '''Multiplicative decrease. A burst of 429s for requests that were already in flight
+        only counts once per refill interval, so the rate doesn't collapse to min_rate.'''
+        with self.lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+            if self.rate is None:
+                if retry_after:
+                    # The server said how long to wait, that is all we know
+                    return
+                self.rate = max(self.min_rate, self.seed_min_rate, self.__sustained__(now) * self.decrease_factor)
+                self.tokens = 0.0
+                self.last_refill = now
+            elif now - self.last_decrease > 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.tokens = min(self.tokens, 0.0)
+            else:
+                return
+            self.last_decrease = now
+            logger.info(f"RedLock API throttled, backing off to {self.rate:.2f} requests/second")
+
+    def sustained_rate(self):
+        '''Requests/second actually sent over the last window seconds'''
+        with self.lock:
+            return(self.__sustained__(time.monotonic()))
+
+    def __sustained__(self, now):
+        recent = [t for t in self.history if t > now - self.window]
+        if not recent:
+            return(0.0)
+        elapsed = max(now - recent[0], 1.0)
+        return(len(recent) / elapsed)
+
+
+def parse_retry_after(value):
+    '''Return the Retry-After header (seconds or an HTTP date) as seconds, or None'''
+    if not value:
+        return(None)
+    try:
+        return(max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return(None)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return(max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()))
+
+
+def backoff(attempt, retry_after=None, base=0.5, cap=30):
+    '''Full jitter exponential backoff, never shorter than the server's Retry-After'''
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return(delay)
@@ -0,0 +1,281 @@
+import sys
+
+import logging
+logger = logging.getLogger()
+
+
+# How a field is stored, besides as-is
+INTERN = "intern" # str, through sys.intern()
+INTERN_LIST = "intern_list" # list of str, kept as a tuple of interned strings
+
+
+class RedLockRecord(object):
+    """
+    Compact, read-mostly stand-in for a raw RedLock JSON dict.
+
+    Subclasses list their fields as (attribute, path in the JSON, how to store it) and get one
+    __slots__ entry per field instead of a per-object __dict__. Strings that repeat across a
+    tenant (ids, cloud types, statuses, policy names) are interned so each distinct value is held
+    once. A field can also be a list of another record class (eg complianceMetadata).
+
+    Keys that aren't fields are kept as they are in extra, so to_json() gives back the original
+    dict. Fields that are missing or null read as None. Explicit nulls and empty nested objects
+    stay in extra, so they are written back out too.
+    """
+
+    __slots__ = ("extra",)
+    fields = ()
+    # A dict here makes lists of this record share one instance per distinct (flat) JSON object
+    shared = None
+
+    def __init__(self, **kwargs):
+        self.extra = None
+        for name, path, kind in self.fields:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise TypeError(f"Unknown {self.__class__.__name__} fields: {', '.join(kwargs)}")
+
+    def __repr__(self):
+        return(f"<{self.__class__.__name__} {getattr(self, self.fields[0][0])}>")
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return(NotImplemented)
+        return(self.extra == other.extra and all(getattr(self, f[0]) == getattr(other, f[0]) for f in self.fields))
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Fields grouped by where they live: top level, or one nested object down
+        cls.top_fields = []
+        cls.nested_fields = {}
+        for name, path, kind in cls.fields:
+            if len(path) == 1:
+                cls.top_fields.append((name, path[0], kind))
+            elif len(path) == 2:
+                cls.nested_fields.setdefault(path[0], []).append((name, path[1], kind))
+            else:
+                raise ValueError(f"{cls.__name__}.{name}: fields can only be one object deep")
+        cls.nested_fields = list(cls.nested_fields.items())
+
+    @classmethod
+    def from_json(cls, data):
+        '''Build a record from a raw API dict. data is not modified'''
+        record = cls.__new__(cls)
+        rest = dict(data)
+        for name, key, kind in cls.top_fields:
+            # An explicit null stays in extra
+            setattr(record, name, store(rest.pop(key) if rest.get(key) is not None else None, kind))
+
+        for parent, specs in cls.nested_fields:
+            child = rest.get(parent)
+            if isinstance(child, dict):
+                child = dict(child)
+                found = False
+                for name, key, kind in specs:
+                    value = child.pop(key) if child.get(key) is not None else None
+                    found = found or value is not None
+                    setattr(record, name, store(value, kind))
+                # Keep whatever is left of the nested object. Drop it if the fields rebuild it,
+                # keep it even when empty if they don't
+                if child or not found:
+                    rest[parent] = child
+                else:
+                    del rest[parent]
+            else:
+                for name, key, kind in specs:
+                    setattr(record, name, None)
+        record.extra = rest or None
+        return(record)
+
+    @classmethod
+    def from_json_shared(cls, data):
+        '''from_json(), but equal flat dicts give the same record. Those records must be treated as read-only'''
+        try:
+            key = tuple(data.items())
+            record = cls.shared.get(key)
+        except TypeError:
+            # Nested values aren't hashable
+            return(cls.from_json(data))
+        if record is None:
+            record = cls.shared.setdefault(key, cls.from_json(data))
+        return(record)
+
+    @classmethod
+    def from_json_list(cls, items):
+        return([cls.from_json(i) for i in items])
+
+    def to_json(self):
+        '''The raw API dict this record stands for'''
+        data = dict(self.extra) if self.extra else {}
+        copied = set()
+        for name, path, kind in self.fields:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            container = data
+            for depth in range(len(path) - 1):
+                prefix = path[:depth + 1]
+                if prefix not in copied:
+                    container[path[depth]] = dict(container.get(path[depth]) or {})
+                    copied.add(prefix)
+                container = container[path[depth]]
+            container[path[-1]] = load(value, kind)
+        return(data)
+
+
+def store(value, kind):
+    '''JSON value -> what the record holds'''
+    if kind is None or value is None:
+        return(value)
+    if kind is INTERN:
+        return(sys.intern(value) if type(value) is str else value)
+    if kind == INTERN_LIST:
+        return(tuple(sys.intern(v) if type(v) is str else v for v in value))
+    if kind.shared is not None:
+        return(tuple(kind.from_json_shared(v) for v in value))
+    return(tuple(kind.from_json(v) for v in value))
+
+
+def load(value, kind):
+    '''What the record holds -> JSON value'''
+    if kind == INTERN_LIST:
+        return(list(value))
+    if isinstance(kind, type):
+        return([v.to_json() for v in value])
+    return(value)
+
+
+def field_specs(*specs):
+    '''Field specs from (attribute, "dotted.json.path"[, kind]) tuples'''
+    output = []
+    for spec in specs:
+        name, path = spec[0], tuple(spec[1].split("."))
+        output.append((name, path, spec[2] if len(spec) > 2 else None))
+    return(tuple(output))
+
+
+class RedLockSectionRecord(RedLockRecord):
+    """
+    A compliance section: an entry of compliance/requirement/{id}/section, or a
+    complianceMetadata entry of a policy
+
+    Every alert of a policy carries the same sections, so sections inside other records are
+    shared (see from_json_shared). clear_shared() empties that table.
+    """
+
+    shared = {}
+    fields = field_specs(
+        ("sectionId", "sectionId", INTERN),
+        ("id", "id"),
+        ("description", "description", INTERN),
+        ("complianceId", "complianceId", INTERN),
+        ("policyId", "policyId", INTERN),
+        ("standardName", "standardName", INTERN),
+        ("standardDescription", "standardDescription", INTERN),
+        ("requirementId", "requirementId", INTERN),
+        ("requirementName", "requirementName", INTERN),
+        ("sectionDescription", "sectionDescription", INTERN),
+        ("sectionLabel", "sectionLabel", INTERN),
+        ("customAssigned", "customAssigned"),
+    )
+    __slots__ = tuple(f[0] for f in fields)
+
+
+class RedLockPolicyRecord(RedLockRecord):
+    """A policy, as returned by policy/{id} or the policy listing"""
+    fields = field_specs(
+        ("policyId", "policyId", INTERN),
+        ("name", "name", INTERN),
+        ("policyType", "policyType", INTERN),
+        ("severity", "severity", INTERN),
+        ("cloudType", "cloudType", INTERN),
+        ("enabled", "enabled"),
+        ("systemDefault", "systemDefault"),
+        ("deleted", "deleted"),
+        ("description", "description", INTERN),
+        ("recommendation", "recommendation", INTERN),
+        ("labels", "labels", INTERN_LIST),
+        ("lastModifiedOn", "lastModifiedOn"),
+        ("lastModifiedBy", "lastModifiedBy", INTERN),
+        ("complianceMetadata", "complianceMetadata", RedLockSectionRecord),
+    )
+    __slots__ = tuple(f[0] for f in fields)
+
+
+class RedLockAccountRecord(RedLockRecord):
+    """A cloud account, as returned by the cloud listing or cloud/{type}/{id}"""
+    fields = field_specs(
+        ("accountId", "accountId", INTERN),
+        ("name", "name", INTERN),
+        ("cloudType", "cloudType", INTERN),
+        ("accountType", "accountType", INTERN),
+        ("enabled", "enabled"),
+        ("lastModifiedTs", "lastModifiedTs"),
+        ("groupIds", "groupIds", INTERN_LIST),
+    )
+    __slots__ = tuple(f[0] for f in fields)
+
+
+class RedLockAlertRecord(RedLockRecord):
+    """An alert, as returned in the v2/alert items. The policy and resource summaries are flattened"""
+    fields = field_specs(
+        ("id", "id"),
+        ("status", "status", INTERN),
+        ("firstSeen", "firstSeen"),
+        ("lastSeen", "lastSeen"),
+        ("alertTime", "alertTime"),
+        ("lastUpdated", "lastUpdated"),
+        ("policyId", "policyId", INTERN),
+        ("policyName", "policy.name", INTERN),
+        ("policyType", "policy.policyType", INTERN),
+        ("severity", "policy.severity", INTERN),
+        ("complianceMetadata", "policy.complianceMetadata", RedLockSectionRecord),
+        ("rrn", "resource.rrn"),
+        ("resourceId", "resource.id"),
+        ("resourceName", "resource.name"),
+        ("accountName", "resource.account", INTERN),
+        ("accountId", "resource.accountId", INTERN),
+        ("cloudType", "resource.cloudType", INTERN),
+        ("region", "resource.region", INTERN),
+        ("resourceType", "resource.resourceType", INTERN),
+        ("resourceApiName", "resource.resourceApiName", INTERN),
+    )
+    # policyIdNested: policyId was read from policy.policyId, the alert had no top level one
+    __slots__ = tuple(f[0] for f in fields) + ("policyIdNested",)
+
+    def __init__(self, **kwargs):
+        self.policyIdNested = False
+        super().__init__(**kwargs)
+
+    @classmethod
+    def from_json(cls, data):
+        '''Some alerts only carry the policy id inside policy, fall back to it like the dict readers do'''
+        record = super().from_json(data)
+        record.policyIdNested = False
+        if record.policyId is None:
+            policy_id = (data.get('policy') or {}).get('policyId')
+            if policy_id is not None:
+                # It is still in extra, so to_json() gives it back where it was
+                record.policyId = store(policy_id, INTERN)
+                record.policyIdNested = True
+        return(record)
+
+    def to_json(self):
+        data = super().to_json()
+        if self.policyIdNested:
+            if self.extra and 'policyId' in self.extra:
+                data['policyId'] = self.extra['policyId'] # an explicit null
+            else:
+                del data['policyId']
+        return(data)
+
+
+def clear_shared():
+    '''Forget the shared section records (they stay alive as long as records use them)'''
+    RedLockSectionRecord.shared.clear()
+
+
+def iter_records(cls, items):
+    '''Convert raw dicts to records one at a time, eg iter_records(RedLockAlertRecord, iter_alerts(...))'''
+    for item in items:
+        yield cls.from_json(item)
@@ -9,11 +9,19 @@ import getpass
 import datetime
 from dateutil import tz
 import copy
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 import requests
 
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from redlock_sdk.rate_limit import RedLockRateLimiter, parse_retry_after, backoff
+from redlock_sdk.cache import RedLockResponseCache, cache_key, top_level_resource
+from redlock_sdk.codec import RedLockCodec, get_codec
+from redlock_sdk.identity import RedLockIdentityMap
+
 import logging
 logger = logging.getLogger()
 
@@ -32,10 +40,19 @@ class RedLockAPI(object):
     # Max number of retries for any reason
     max_retries = 5
     # Always retry on these statuses, within the requests session.
-    # We retry for auth failure (401) within the SDK code. See try_wrapper().
-    retry_statuses = [429, 500, 502, 503, 504]
+    # We retry for auth failure (401) and throttling (429) within the SDK code. See try_wrapper().
+    retry_statuses = [500, 502, 503, 504]
+    # Verbs that are safe to replay after a 429
+    idempotent_methods = ["GET", "PUT", "DELETE", "HEAD", "OPTIONS"]
+
+    # Identical concurrent GETs share one request. See get().
+    coalesce = True
+
+    # RedLock tokens are valid for 10 minutes. Refresh them this many seconds before they expire.
+    token_lifetime = 600
+    token_refresh_margin = 60
 
-    def __init__(self, endpoint, customerName=None, debug=False):
+    def __init__(self, endpoint, customerName=None, debug=False, rate_limit=None, pool_maxsize=10, cache=None, metrics=None, codec=None, identity_map=True):
         super(RedLockAPI, self).__init__()
 
 
@@ -47,14 +64,47 @@ class RedLockAPI(object):
         self.endpoint = endpoint
         self.customerName = customerName
         self.header = None # Set to none and reset after authenticating
+        self.token_expires = None
+        self.auth_generation = 0 # Bumped every time the token changes
+        self.auth_lock = threading.Lock()
+        self._credentials = None # (username, password) kept for re-login
+        self.inflight = {} # (cache_key, write generation) -> Future of the GET currently fetching it
+        self.inflight_lock = threading.Lock()
+        self.write_generations = {} # top level resource -> writes to it so far
+
+        # rate_limit is requests/second, or a RedLockRateLimiter to share between clients
+        if isinstance(rate_limit, RedLockRateLimiter):
+            self.rate_limiter = rate_limit
+        else:
+            self.rate_limiter = RedLockRateLimiter(rate=rate_limit)
+
+        # cache=True uses RedLockResponseCache defaults, or pass a configured RedLockResponseCache
+        if cache is True:
+            self.cache = RedLockResponseCache()
+        elif cache is False:
+            self.cache = None
+        else:
+            self.cache = cache
+
+        # A metrics.RedLockMetrics to record per endpoint request stats into
+        self.metrics = metrics
+
+        # JSON codec for bodies: a codec.RedLockCodec, a codec name, or None for the fastest installed
+        self.codec = codec if isinstance(codec, RedLockCodec) else get_codec(codec)
+
+        # Model objects built on this client are shared per entity. identity_map=False turns that off
+        self.identity_map = RedLockIdentityMap() if identity_map else None
 
         self.client = requests.Session()
         self.retries = Retry(total=self.max_retries,
                                  status_forcelist=self.retry_statuses,
-                                 backoff_factor=1)
+                                 backoff_factor=1,
+                                 raise_on_status=False)
+        # Size the pool to the number of threads that will share this client (see map_call())
+        self.pool_maxsize = pool_maxsize
         self.redlock_http_adapter = HTTPAdapter(pool_connections=1,
-                                                    pool_maxsize=10)
-                                                    # max_retries=self.retries)
+                                                    pool_maxsize=self.pool_maxsize,
+                                                    max_retries=self.retries)
         self.session_mount = "https://"
         self.client.mount(self.session_mount, self.redlock_http_adapter)
 
@@ -85,28 +135,120 @@ class RedLockAPI(object):
             else:
                 password = self.__get_password__(username)
 
-            url = "{}/login".format(self.endpoint)
-            if self.customerName is not None:
-                body = {"username":username,"password":password,"customerName":self.customerName} # FIXME to support customerName
-            else:
-                body = {"username":username,"password":password}
-
-            resp = self.client.post(url, json=body)
+            resp = self.__login__(username, password)
             if resp.status_code == 200:
-                auth_resp_json = resp.json()
-                token = auth_resp_json["token"]
-                self.auth_token = token
                 self.username = username
-                self.header = {"x-redlock-auth": self.auth_token,"Content-Type": "application/json"}
-                self.client.headers.update(self.header)
+                self._credentials = (username, password)
                 return True
             else:
-                logger.error(f"Failed to authenticate as {username} to {url}: {resp}")
+                logger.error(f"Failed to authenticate as {username} to {resp.url}: {resp}")
                 return False
         except Exception as e:
             logger.error("Exception Authenticating to RedLock: {}".format(e))
             return False
 
+    def __login__(self, username, password):
+        '''POST the credentials to /login and install the token on success'''
+        url = "{}/login".format(self.endpoint)
+        if self.customerName is not None:
+            body = {"username":username,"password":password,"customerName":self.customerName} # FIXME to support customerName
+        else:
+            body = {"username":username,"password":password}
+
+        resp = self.client.post(url, json=body)
+        if resp.status_code == 200:
+            self.__set_token__(resp.json()["token"])
+        return(resp)
+
+    def __set_token__(self, token):
+        '''Install a new token on the session and restart the expiry clock'''
+        self.auth_token = token
+        self.header = {"x-redlock-auth": self.auth_token,"Content-Type": "application/json"}
+        self.client.headers.update(self.header)
+        self.token_expires = time.monotonic() + self.token_lifetime
+        self.auth_generation += 1
+
+    def reauthenticate(self, generation=None, extend=False):
+        '''Refresh the auth token. Single-flight: concurrent callers queue on auth_lock, and any
+        caller whose token generation is already stale just reuses the token the winner obtained.
+        With extend=True the still-valid token is extended first; a full re-login is the fallback.'''
+        with self.auth_lock:
+            if generation is not None and generation != self.auth_generation:
+                return True
+
+            if extend and self.header is not None:
+                resp = self.client.get(f"{self.endpoint}/auth_token/extend")
+                if resp.status_code == 200:
+                    self.__set_token__(resp.json()["token"])
+                    return True
+
+            if self._credentials is None:
+                return False
+            logger.info(f"Re-authenticating to RedLock as {self._credentials[0]}")
+            resp = self.__login__(*self._credentials)
+            if resp.status_code != 200:
+                logger.error(f"Failed to re-authenticate as {self._credentials[0]}: {resp}")
+            return(resp.status_code == 200)
+
+    def try_wrapper(self, method, path, **kwargs):
+        '''Send a request to the API. Refreshes the token shortly before it expires,
+        and on a 401 re-authenticates once and replays the request. Every send goes through
+        the rate limiter; 429s slow it down and idempotent verbs are retried with jitter.'''
+        url = f"{self.endpoint}/{path}"
+        if self.metrics is not None:
+            started = time.perf_counter()
+        sends = 0
+        for attempt in range(self.max_retries + 1):
+            generation = self.auth_generation
+            if self.token_expires is not None and time.monotonic() > self.token_expires - self.token_refresh_margin:
+                self.reauthenticate(generation, extend=True)
+                generation = self.auth_generation
+
+            self.rate_limiter.acquire()
+            response = self.client.request(method, url, **kwargs)
+            sends += 1
+            if response.status_code == 401 and self.reauthenticate(generation):
+                response.close()
+                self.rate_limiter.acquire()
+                response = self.client.request(method, url, **kwargs)
+                sends += 1
+
+            if response.status_code != 429:
+                self.rate_limiter.on_success()
+                break
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.on_throttle(retry_after)
+            if method not in self.idempotent_methods or attempt == self.max_retries:
+                break
+            response.close()
+            delay = backoff(attempt, retry_after)
+            logger.warning(f"{method} {path} throttled (429), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        if self.metrics is not None:
+            self.__record__(method, path, response, time.perf_counter() - started, sends, kwargs)
+        return(response)
+
+    def __record__(self, method, path, response, elapsed, sends, kwargs):
+        '''Report one request to self.metrics'''
+        data = kwargs.get("data")
+        request_bytes = len(data.encode() if isinstance(data, str) else data or b"")
+        if kwargs.get("stream"):
+            response_bytes = int(response.headers.get("Content-Length") or 0)
+        else:
+            response_bytes = len(response.content)
+        # Retries done by the SDK, plus the ones urllib3 did underneath it
+        retries = sends - 1
+        urllib3_retries = getattr(response.raw, "retries", None)
+        if urllib3_retries is not None:
+            retries += len(urllib3_retries.history)
+        self.metrics.record(method, path, response.status_code, elapsed, request_bytes, response_bytes, retries)
+
+    def request_rate(self):
+        '''Sustained requests/second this client has sent over the last minute'''
+        return(self.rate_limiter.sustained_rate())
+
 
     def get(self, path, params=None):
         '''Executes a GET operation against the API for the path specificed'''
@@ -114,24 +256,83 @@ class RedLockAPI(object):
         if self.header is None:
             raise RedLockAPIUnauthenticated(f"Cannot get {path}: Not Authenticated")
 
+        if not self.coalesce:
+            return(self.__fetch__(path, params))
+
+        # Single-flight: the first caller for a (path, params) does the request, anyone asking
+        # for the same thing while it is in flight waits for and shares that response.
+        # A GET made after a write never joins one that started before it
+        with self.inflight_lock:
+            key = (cache_key(path, params), self.write_generations.get(top_level_resource(path), 0))
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return(future.result())
+
+        try:
+            response = self.__fetch__(path, params)
+            future.set_result(response)
+            return(response)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+
+    def __fetch__(self, path, params=None):
+        '''GET through the response cache (if enabled) and the API'''
         url = f"{self.endpoint}/{path}"
 
         if self.debug:
             logger.debug(f"Getting {url} with params {params}")
 
-        response = self.client.get(url, params=params)
+        entry = None
+        headers = None
+        if self.cache is not None:
+            entry, fresh = self.cache.lookup(path, params)
+            if fresh:
+                if self.metrics is not None:
+                    self.metrics.record_cache_hit("GET", path)
+                return(entry.response)
+            if entry is not None:
+                headers = entry.validators()
+
+        response = self.try_wrapper("GET", path, params=params, headers=headers)
 
         if self.debug:
             logger.debug(f"Response: {response.text}")
 
-        if response.status_code == 200:
-            return(response)
-        else:
-            if 'x-redlock-status' in response.headers and response.headers['x-redlock-status'][0]['i18nKey'] == "not_found":
-                raise RedLockResourceNotFound(response)
-            else:
-                raise RedLockAPIError(response)
+        if entry is not None and response.status_code == 304:
+            self.cache.revalidated(entry)
+            if self.metrics is not None:
+                self.metrics.record_cache_hit("GET", path)
+            return(entry.response)
 
+        check_response(response, ok_statuses=[200])
+        if self.cache is not None:
+            self.cache.store(path, params, response)
+        return(response)
+
+
+    def get_json(self, path, params=None):
+        '''get() and decode the body with this client's codec'''
+        return(self.codec.loads(self.get(path, params=params).content))
+
+    def get_stream(self, path, params=None):
+        '''Executes a GET without reading the body into memory, for very large responses such as v2/alert.
+        Bypasses the cache and coalescing. Read it with iter_content() and close() it when done.'''
+
+        if self.header is None:
+            raise RedLockAPIUnauthenticated(f"Cannot get {path}: Not Authenticated")
+
+        if self.debug:
+            logger.debug(f"Streaming {self.endpoint}/{path} with params {params}")
+
+        response = self.try_wrapper("GET", path, params=params, stream=True)
+        return(check_response(response, ok_statuses=[200]))
 
     def put(self, path, data=None):
         '''Executes a PUT operation against the API for the path specificed'''
@@ -144,11 +345,9 @@ class RedLockAPI(object):
         if self.debug:
             logger.debug(f"Putting {url} with data {data}")
 
-        response = self.client.put(url, data=json.dumps(data))
-        if response.status_code == 200 or response.status_code == 204:
-            return(response)
-        else:
-            raise RedLockAPIError(response)
+        response = self.try_wrapper("PUT", path, data=self.codec.dumps(data))
+        self.__written__(path)
+        return(check_response(response, check_not_found=False))
 
     def post(self, path, data=None):
         '''Executes a POST operation against the API for the path specificed'''
@@ -161,15 +360,13 @@ class RedLockAPI(object):
         if self.debug:
             logger.debug(f"Posting {url} with data {data}")
 
-        response = self.client.post(url, data=json.dumps(data))
+        response = self.try_wrapper("POST", path, data=self.codec.dumps(data))
+        self.__written__(path)
         if self.debug:
             logger.debug(f"Headers: {response.headers}")
             logger.debug(f"Body: {response.text}")
 
-        if response.status_code == 200 or response.status_code == 204:
-            return(response)
-        else:
-            raise RedLockAPIError(response)
+        return(check_response(response, check_not_found=False))
 
     def delete(self, path):
         '''Executes a DELETE operation against the API for the path specificed'''
@@ -182,18 +379,72 @@ class RedLockAPI(object):
         if self.debug:
             logger.debug(f"Deleting {url}")
 
-        response = self.client.delete(url)
+        response = self.try_wrapper("DELETE", path)
+        self.__written__(path)
         if self.debug:
             logger.debug(f"Headers: {response.headers}")
             logger.debug(f"Body: {response.text}")
 
-        if response.status_code == 200 or response.status_code == 204:
-            return(response)
-        else:
-            if 'x-redlock-status' in response.headers and response.headers['x-redlock-status'][0]['i18nKey'] == "not_found":
-                raise RedLockResourceNotFound(response)
+        return(check_response(response))
+
+    def __written__(self, path):
+        '''After a write: drop cached GETs of the resource and stop new GETs joining ones already in flight'''
+        resource = top_level_resource(path)
+        with self.inflight_lock:
+            self.write_generations[resource] = self.write_generations.get(resource, 0) + 1
+        if self.cache is not None:
+            self.cache.invalidate(path)
+
+    def map_call(self, calls, max_workers=None):
+        '''Run many API calls concurrently on a thread pool.
+
+        Each call is either a callable taking no arguments, or a tuple of
+        (verb, path[, params_or_data]), eg ("get", "cloud/aws/1234") or ("put", "cloud/group/x", payload).
+        Returns a list in the same order as calls. A call that raised has its exception in its
+        slot instead of a result, so one failure never aborts the batch.
+        '''
+        calls = list(calls)
+        if not calls:
+            return([])
+
+        def run(call):
+            try:
+                if callable(call):
+                    return(call())
+                verb, path, *args = call
+                return(getattr(self, verb.lower())(path, *args))
+            except Exception as e:
+                return(e)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers or self.pool_maxsize, len(calls))) as executor:
+            return(list(executor.map(run, calls)))
+
+    def map_get(self, paths_or_params, max_workers=None):
+        '''GET many paths concurrently. Items are a path, or a (path, params) tuple.
+        Returns responses (or the exception raised for that item) in input order.'''
+        calls = []
+        for item in paths_or_params:
+            if isinstance(item, str):
+                calls.append(("get", item))
             else:
-                raise RedLockAPIError(response)
+                calls.append(("get", item[0], item[1]))
+        return(self.map_call(calls, max_workers=max_workers))
+
+
+def check_response(response, ok_statuses=(200, 204), check_not_found=True):
+    '''Return the response if its status is ok, otherwise raise the matching RedLock exception.
+
+    Works on anything shaped like a requests.Response (status_code, reason, headers,
+    raise_for_status()), so the sync and async clients raise identical errors.
+    '''
+    if response.status_code in ok_statuses:
+        return(response)
+    if check_not_found and 'x-redlock-status' in response.headers:
+        # The header is a JSON encoded list of status blocks
+        rl_status = json.loads(response.headers['x-redlock-status'])
+        if rl_status and rl_status[0].get('i18nKey') == "not_found":
+            raise RedLockResourceNotFound(response)
+    raise RedLockAPIError(response)
 
 class RedLockAPIError(Exception):
     '''raised when the RedLock API fails to process a request'''
@@ -21,15 +21,25 @@ except ImportError as e:
     exit(1)
 
 
-class RedLockReport(object):
+class RedLockReport(lazy.RedLockLazyMixin, identity.RedLockIdentityMixin):
     """
     Abstraction class for a Cloud AccountGroup in RedLock
     """
 
-    def __init__(self, api, report_name, report_id=None, debug=False):
+    identity_type = "report"
+    identity_arg = "report_name"
+
+    def __init__(self, api, report_name, report_id=None, debug=False, lazy=False):
         self.api = api
         self.debug = debug
 
+        if lazy:
+            self.name = report_name
+            if report_id is not None:
+                self.report_id = report_id
+            self._loaded = False
+            return
+
         if report_id is None:
             # We don't know the id, must find it
             report_id = self.__find_id__(report_name)
@@ -42,7 +52,7 @@ class RedLockReport(object):
 
     def __find_id__(self, report_name):
         '''Given the name (primary key) get the id (which is neede by the API)'''
-        reports = self.api.get(f"report").json()
+        reports = self.api.get_json(f"report")
         for r in reports:
             if r['name'] == report_name:
                 return(r['id'])
@@ -68,9 +78,58 @@ class RedLockReport(object):
 
     def get(self):
         '''Get the data from the API for this account group'''
-        self.reportData = self.api.get(f"report/{self.report_id}").json()
+        self.reportData = self.api.get_json(f"report/{self.report_id}")
         self.__dict__.update(self.reportData)
 
+    def __load__(self):
+        if "report_id" not in self.__dict__:
+            report_id = self.__find_id__(self.name)
+            if report_id is None:
+                raise RedLockAccountReportNotFoundError(self.name)
+            self.report_id = report_id
+        self.get()
+
+    @classmethod
+    def from_data(cls, api, reportData, debug=False):
+        '''Build a report from a report/{id} body or an entry of the report listing, without calling the API'''
+        report = cls.__identity__(api, reportData['name'])
+        if report is None:
+            report = cls.__new__(cls)
+            report.api = api
+            report.debug = debug
+            report = cls.__register__(api, reportData['name'], report)
+        report.report_id = reportData['id']
+        report.reportData = reportData
+        report.__dict__.update(report.reportData)
+        return(report)
+
+    @classmethod
+    def from_inventory(cls, inventory, name_or_id):
+        '''Build a report from a local inventory.RedLockInventory instead of the network'''
+        reportData = inventory.lookup("report", name_or_id)
+        if reportData is None:
+            raise RedLockAccountReportNotFoundError(name_or_id)
+        return(cls.from_data(inventory.api, reportData))
+
+    @classmethod
+    def __prefetch__(cls, api, reports, max_workers=None):
+        '''Fill many lazy reports: one report listing to resolve ids by name (if needed),
+        then concurrent report/{id} fetches. See lazy.prefetch()'''
+        if any("report_id" not in r.__dict__ for r in reports):
+            by_name = {r['name']: r['id'] for r in api.get_json("report")}
+            for r in reports:
+                if "report_id" not in r.__dict__:
+                    if r.name not in by_name:
+                        raise RedLockAccountReportNotFoundError(r.name)
+                    r.report_id = by_name[r.name]
+
+        responses = api.map_get([f"report/{r.report_id}" for r in reports], max_workers=max_workers)
+        for report, response in zip(reports, responses):
+            if isinstance(response, Exception):
+                raise response
+            report.reportData = api.codec.loads(response.content)
+            report.__dict__.update(report.reportData)
+
     def download(self, filename):
         r = self.api.get(f"report/{self.report_id}/download")
         if r.status_code == 200:
@@ -20,25 +20,66 @@ except ImportError as e:
     print("Error: {}".format(e))
     exit(1)
 
-class RedLockStandard(object):
+class RedLockStandard(lazy.RedLockLazyMixin, identity.RedLockIdentityMixin):
     """
     Abstraction class for a Compliance Standard in RedLock
     """
-    def __init__(self, api, complianceId, debug=False):
+
+    identity_type = "compliance"
+    identity_arg = "complianceId"
+
+    def __init__(self, api, complianceId, debug=False, lazy=False):
         # super(RedLockStandard, self).__init__()
 
         self.uuid = complianceId
         self.api = api
         self.debug = debug
+        self.requirements_data = None
+
+        if lazy:
+            self._loaded = False
+        else:
+            self.get()
 
+    def get(self):
+        '''Get the data from the API for this standard'''
         # This is stupid. I can't just get a single Compliance Standard.
         # I have to get them all, then iterate to get the attributes for this one
-        all_standards = self.api.get("compliance").json()
+        all_standards = self.api.get_json("compliance")
         for s in all_standards:
-            if s['id'] == complianceId:
+            if s['id'] == self.uuid:
                 self.__dict__.update(s)
 
-        self.requirements_data = None
+    @classmethod
+    def from_data(cls, api, complianceData, debug=False):
+        '''Build a standard from an entry of the compliance listing, without calling the API'''
+        standard = cls.__identity__(api, complianceData['id'])
+        if standard is None:
+            standard = cls.__new__(cls)
+            standard.uuid = complianceData['id']
+            standard.api = api
+            standard.debug = debug
+            standard.requirements_data = None
+            standard = cls.__register__(api, standard.uuid, standard)
+        standard.__dict__.update(complianceData)
+        return(standard)
+
+    @classmethod
+    def from_inventory(cls, inventory, name_or_id):
+        '''Build a standard from a local inventory.RedLockInventory instead of the network'''
+        complianceData = inventory.lookup("standard", name_or_id)
+        if complianceData is None:
+            raise Exception(f"Compliance standard {name_or_id} is not in the inventory")
+        return(cls.from_data(inventory.api, complianceData))
+
+    @classmethod
+    def __prefetch__(cls, api, standards, max_workers=None):
+        '''Fill many lazy standards from one compliance listing. See lazy.prefetch()'''
+        by_id = {s['id']: s for s in api.get_json("compliance")}
+        for standard in standards:
+            if standard.uuid not in by_id:
+                raise Exception(f"Compliance standard {standard.uuid} was not found")
+            standard.__dict__.update(by_id[standard.uuid])
 
     def __str__(self):
         """when converted to a string, become the account_id"""
@@ -65,8 +106,7 @@ class RedLockStandard(object):
 
     def list_requirements(self):
         '''returns the raw json from RedLock API'''
-        response = self.api.get(f"compliance/{self.uuid}/requirement")
-        self.requirements_data = response.json()
+        self.requirements_data = self.api.get_json(f"compliance/{self.uuid}/requirement")
         return(self.requirements_data)
 
     def requirements(self):
@@ -123,8 +163,8 @@ class RedLockStandard(object):
             return(all_reqs[requirement_number])
 
 
-    def get_alerts(self, policy_type=None):
-
+    def alert_querystring(self, policy_type=None):
+        '''v2/alert filters for open alerts on this standard'''
         querystring = {
                     "timeType": "relative",
                     "timeAmount": "1000",
@@ -135,9 +175,16 @@ class RedLockStandard(object):
                     }
         if policy_type is not None:
             querystring['policy.type'] = policy_type
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+        return(querystring)
+
+    def get_alerts(self, policy_type=None):
+        querystring = self.alert_querystring(policy_type)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
+
+    def iter_alerts(self, policy_type=None):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type)))
 
 
 class RedLockStandardRequirement(object):
@@ -162,13 +209,12 @@ class RedLockStandardRequirement(object):
 
     def list_sections(self):
         '''list all the subsections for this part of the standard'''
-        response = self.api.get(f"compliance/{self.uuid}/section")
-        return(response.json())
+        return(self.api.get_json(f"compliance/{self.uuid}/section"))
 
     def sections(self):
         '''returns an array of all sections'''
         output = []
-        sections_data = self.list_sections().json()
+        sections_data = self.list_sections()
         for sectionData in sections_data:
             section = RedLockStandardSection(self.api, sectionData, self, self.debug)
             output.append(section)
@@ -217,7 +263,8 @@ class RedLockStandardRequirement(object):
         '''Delete this Requirement'''
         raise NotImplementedError
 
-    def get_alerts(self, policy_type=None):
+    def alert_querystring(self, policy_type=None):
+        '''v2/alert filters for open alerts on this requirement'''
         querystring = {
                     "timeType": "relative",
                     "timeAmount": "1000",
@@ -229,9 +276,16 @@ class RedLockStandardRequirement(object):
                     }
         if policy_type is not None:
             querystring['policy.type'] = policy_type
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+        return(querystring)
+
+    def get_alerts(self, policy_type=None):
+        querystring = self.alert_querystring(policy_type)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
+
+    def iter_alerts(self, policy_type=None):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type)))
 
 
 class RedLockStandardSection(object):
@@ -266,7 +320,8 @@ class RedLockStandardSection(object):
     def delete(self, sectionId):
         raise NotImplementedError
 
-    def get_alerts(self, policy_type=None):
+    def alert_querystring(self, policy_type=None):
+        '''v2/alert filters for open alerts on this section'''
         querystring = {
                     "timeType": "relative",
                     "timeAmount": "1000",
@@ -279,13 +334,20 @@ class RedLockStandardSection(object):
                     }
         if policy_type is not None:
             querystring['policy.type'] = policy_type
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+        return(querystring)
+
+    def get_alerts(self, policy_type=None):
+        querystring = self.alert_querystring(policy_type)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
+
+    def iter_alerts(self, policy_type=None):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type)))
 
     def get_complianceData(self):
         '''Return the complianceId which is a unique id in the policy API for this combination of standard/requirement/section.'''
-        blob = self.api.get("policy/compliance").json()
+        blob = self.api.get_json("policy/compliance")
 
         print(self.standard.name)
 
@@ -301,18 +363,65 @@ class RedLockStandardSection(object):
         # Not found
         return(None)
 
-class RedLockPolicy(object):
+class RedLockPolicy(lazy.RedLockLazyMixin, identity.RedLockIdentityMixin):
     """
     Abstraction class for a Compliance Standard Section (ie sub-section of requirement) in RedLock
     """
-    def __init__(self, api, policy_id, debug=False):
+
+    identity_type = "policy"
+    identity_arg = "policy_id"
+
+    def __init__(self, api, policy_id, debug=False, lazy=False):
         # super(RedLockStandard, self).__init__()
         self.api = api
         self.debug = debug
         self.uuid = policy_id
-        self.policyData = self.api.get(f"policy/{self.uuid}").json()
+        if lazy:
+            self._loaded = False
+        else:
+            self.get()
+
+    def get(self):
+        '''Get the data from the API for this policy'''
+        self.policyData = self.api.get_json(f"policy/{self.uuid}")
         self.__dict__.update(self.policyData)
 
+    @classmethod
+    def from_data(cls, api, policyData, debug=False):
+        '''Build a policy from a policy/{id} body or an entry of the policy listing, without calling the API'''
+        policy = cls.__identity__(api, policyData['policyId'])
+        if policy is None:
+            policy = cls.__new__(cls)
+            policy.api = api
+            policy.debug = debug
+            policy.uuid = policyData['policyId']
+            policy = cls.__register__(api, policy.uuid, policy)
+        policy.policyData = policyData
+        policy.__dict__.update(policy.policyData)
+        return(policy)
+
+    @classmethod
+    def from_inventory(cls, inventory, policy_id):
+        '''Build a policy from a local inventory.RedLockInventory instead of the network'''
+        policyData = inventory.get("policy", policy_id)
+        if policyData is None:
+            raise Exception(f"Policy {policy_id} is not in the inventory")
+        return(cls.from_data(inventory.api, policyData))
+
+    @classmethod
+    def __prefetch__(cls, api, policies, max_workers=None):
+        '''Fill many lazy policies with concurrent policy/{id} fetches. See lazy.prefetch()'''
+        responses = api.map_get([f"policy/{p.uuid}" for p in policies], max_workers=max_workers)
+        for policy, response in zip(policies, responses):
+            if isinstance(response, Exception):
+                raise response
+            policy.policyData = api.codec.loads(response.content)
+            policy.__dict__.update(policy.policyData)
+
+    def as_record(self):
+        '''This policy's data as a compact records.RedLockPolicyRecord'''
+        return(records.RedLockPolicyRecord.from_json(self.policyData))
+
     def __str__(self):
         """when converted to a string, become the account_id"""
         return(f"{self.name}")
@@ -350,7 +459,8 @@ class RedLockPolicy(object):
         '''https://api.docs.redlock.io/reference#update-policy'''
         raise NotImplementedError
 
-    def get_alerts(self, policy_type=None):
+    def alert_querystring(self, policy_type=None):
+        '''v2/alert filters for open alerts on this policy'''
         querystring = {
                     "timeType": "relative",
                     "timeAmount": "1000",
@@ -361,8 +471,15 @@ class RedLockPolicy(object):
                     }
         if policy_type is not None:
             querystring['policy.type'] = policy_type
-        print(querystring)
-        response = self.api.get(f"v2/alert", params=querystring)
-        return(response.json())
+        return(querystring)
+
+    def get_alerts(self, policy_type=None):
+        querystring = self.alert_querystring(policy_type)
+        logger.debug(f"v2/alert filters: {querystring}")
+        return(self.api.get_json(f"v2/alert", params=querystring))
+
+    def iter_alerts(self, policy_type=None):
+        '''generator version of get_alerts(), yields alerts one at a time as the response streams in'''
+        return(alerts.iter_alerts(self.api, self.alert_querystring(policy_type)))
 
 
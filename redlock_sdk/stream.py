@@ -0,0 +1,123 @@
+import json
+import codecs
+
+import logging
+logger = logging.getLogger()
+
+
+class JSONArrayStream(object):
+    """
+    Incrementally parse a JSON array out of a stream of byte chunks, yielding one element at a time.
+
+    The array can be the whole document ([...]) or one member of a top-level object
+    ({"totalRows": 3, "items": [...], "nextPageToken": "..."}). The object's other members are small,
+    so they are collected into self.meta as they go by. Only the element being decoded and one
+    chunk are held in memory, however long the array is.
+    """
+
+    # Drop consumed text from the buffer once this much has piled up
+    compact_at = 1 << 16
+
+    def __init__(self, chunks, key="items"):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.meta = {}
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+
+    def __iter__(self):
+        c = self.__next_char__()
+        if c == "[":
+            self.pos += 1
+            yield from self.__array__()
+        elif c == "{":
+            self.pos += 1
+            yield from self.__object__()
+        elif c is not None:
+            raise ValueError(f"Expected a JSON array or object, got {c!r}")
+
+    def __fill__(self):
+        '''Read one more chunk. Returns False at end of stream'''
+        if self.eof:
+            return(False)
+        if self.pos > self.compact_at:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer += self.text.decode(chunk)
+                return(True)
+        self.buffer += self.text.decode(b"", final=True)
+        self.eof = True
+        return(False)
+
+    def __next_char__(self):
+        '''Skip whitespace and return the next character without consuming it, None at end'''
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return(self.buffer[self.pos])
+            if not self.__fill__():
+                return(None)
+
+    def __value__(self):
+        '''Decode one complete JSON value at pos, reading more chunks until it is all there'''
+        self.__next_char__()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A value that runs to the end of the buffer (eg a number) may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return(value)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.__fill__()
+
+    def __expect__(self, char):
+        c = self.__next_char__()
+        if c != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, got {c!r}")
+        self.pos += 1
+
+    def __array__(self):
+        while True:
+            c = self.__next_char__()
+            if c == "]":
+                self.pos += 1
+                return
+            if c == ",":
+                self.pos += 1
+                continue
+            if c is None:
+                raise ValueError("Unterminated JSON array")
+            yield self.__value__()
+
+    def __object__(self):
+        while True:
+            c = self.__next_char__()
+            if c == "}":
+                self.pos += 1
+                return
+            if c == ",":
+                self.pos += 1
+                continue
+            if c is None:
+                raise ValueError("Unterminated JSON object")
+            name = self.__value__()
+            self.__expect__(":")
+            if name == self.key and self.__next_char__() == "[":
+                self.pos += 1
+                yield from self.__array__()
+            else:
+                self.meta[name] = self.__value__()
+
+
+def iter_json_array(chunks, key="items"):
+    '''Yield the elements of the JSON array in a stream of byte chunks. See JSONArrayStream'''
+    return(iter(JSONArrayStream(chunks, key=key)))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark of the JSON codecs RedLockAPI can use, on synthetic payloads shaped like
+# real RedLock responses. No login needed.
+
+import json
+import sys
+import time
+import random
+
+try:
+    from redlock_sdk import *
+except ImportError as e:
+    print("must install redlock sdk")
+    print("Error: {}".format(e))
+    exit(1)
+
+
+import logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def make_policy(i):
+    '''A policy as returned by GET policy/{id}'''
+    return({
+        "policyId": f"{random.getrandbits(128):032x}",
+        "name": f"AWS S3 bucket {i} has global view ACL permissions enabled",
+        "policyType": random.choice(["config", "network", "audit_event"]),
+        "systemDefault": True,
+        "description": "This policy identifies S3 buckets that have ACL permissions open to everyone. " * 3,
+        "severity": random.choice(["high", "medium", "low"]),
+        "rule": {
+            "name": f"rule-{i}",
+            "criteria": f"{random.getrandbits(128):032x}",
+            "parameters": {"savedSearch": "true", "withIac": "false"},
+            "type": "Config",
+        },
+        "recommendation": "1. Log in to the AWS console\n2. Navigate to the S3 service\n3. Remove the global grant",
+        "cloudType": "aws",
+        "complianceMetadata": [
+            {
+                "standardName": random.choice(["CIS v1.2.0 (AWS)", "PCI DSS v3.2", "HIPAA", "NIST 800-53 Rev4"]),
+                "standardDescription": "Center for Internet Security Benchmark",
+                "requirementId": str(random.randint(1, 5)),
+                "requirementName": "Identity and Access Management",
+                "sectionId": f"{random.randint(1, 5)}.{random.randint(1, 20)}",
+                "sectionDescription": "Ensure no root account access key exists",
+                "policyId": f"{random.getrandbits(128):032x}",
+                "complianceId": f"{random.getrandbits(128):032x}",
+                "sectionLabel": "1",
+                "customAssigned": False,
+            } for _ in range(random.randint(1, 6))
+        ],
+        "labels": ["PCI", "S3"],
+        "enabled": True,
+        "lastModifiedOn": 1559849015283,
+        "lastModifiedBy": "template@redlock.io",
+        "deleted": False,
+    })
+
+
+def make_alert(i, accounts, policies):
+    '''An alert as returned in GET v2/alert items (detailed=False)'''
+    account_id, account_name = random.choice(accounts)
+    policy = random.choice(policies)
+    return({
+        "id": f"P-{i}",
+        "status": random.choice(["open", "open", "open", "resolved", "dismissed"]),
+        "firstSeen": 1559849015283 + i,
+        "lastSeen": 1559949015283 + i,
+        "alertTime": 1559849015283 + i,
+        "lastUpdated": 1559949015283 + i,
+        "policyId": policy["policyId"],
+        "policy": {
+            "policyId": policy["policyId"],
+            "name": policy["name"],
+            "policyType": policy["policyType"],
+            "severity": policy["severity"],
+            "complianceMetadata": policy["complianceMetadata"],
+        },
+        "resource": {
+            "rrn": f"rrn::bucket:us-east-1:{account_id}:{random.getrandbits(64):016x}:bucket-{i}",
+            "id": f"bucket-{i}",
+            "name": f"bucket-{i}",
+            "account": account_name,
+            "accountId": account_id,
+            "cloudType": "aws",
+            "region": random.choice(["AWS Virginia", "AWS Oregon", "AWS Ireland"]),
+            "resourceType": "BUCKET",
+            "resourceApiName": "aws-s3api-get-bucket-acl",
+            "data": {"acl": {"grants": [{"grantee": {"uri": "http://acs.amazonaws.com/groups/global/AllUsers"}, "permission": "READ"}]}},
+        },
+    })
+
+
+def make_payloads(alert_count):
+    random.seed(42)
+    accounts = [(f"{random.randint(10**11, 10**12 - 1)}", f"account-{a}") for a in range(200)]
+    policies = [make_policy(i) for i in range(300)]
+    inventory = [{
+        "accountId": account_id,
+        "name": name,
+        "cloudType": "aws",
+        "enabled": True,
+        "lastModifiedTs": 1559849015283,
+        "accountType": "account",
+        "groupIds": [f"{random.getrandbits(128):032x}" for _ in range(3)],
+    } for account_id, name in accounts]
+    alert_listing = {
+        "totalRows": alert_count,
+        "items": [make_alert(i, accounts, policies) for i in range(alert_count)],
+    }
+    return([("policy", policies[0]), ("policy listing", policies), ("cloud listing", inventory), ("v2/alert", alert_listing)])
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return(best)
+
+
+def main(args):
+    payloads = make_payloads(args.alerts)
+    json_codecs = codec.available_codecs()
+    print(f"codecs installed: {', '.join(c.name for c in json_codecs)}\n")
+    print(f"{'payload':<16} {'bytes':>12} {'codec':<8} {'encode ms':>10} {'decode ms':>10} {'snapshot ms':>12}")
+
+    for name, payload in payloads:
+        encoded = json.dumps(payload).encode("utf-8")
+        # Small payloads are timed in a loop so the numbers are measurable
+        loops = max(1, 1000000 // len(encoded))
+        for c in json_codecs:
+            assert c.loads(c.dumps(payload)) == payload
+            encode = timed(lambda: [c.dumps(payload) for _ in range(loops)], args.repeat) / loops
+            decode = timed(lambda: [c.loads(encoded) for _ in range(loops)], args.repeat) / loops
+            snapshot = timed(lambda: [c.dumps_snapshot(payload) for _ in range(loops)], args.repeat) / loops
+            print(f"{name:<16} {len(encoded):>12} {c.name:<8} {encode * 1000:>10.3f} {decode * 1000:>10.3f} {snapshot * 1000:>12.3f}")
+
+
+def do_args():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alerts", help="Number of alerts in the v2/alert payload", type=int, default=20000)
+    parser.add_argument("--repeat", help="Take the best of this many runs", type=int, default=5)
+
+    args = parser.parse_args()
+    return(args)
+
+
+if __name__ == '__main__':
+    args = do_args()
+    main(args)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Memory held by alerts, accounts and policies as today's dicts / model objects versus the
+# slotted records in redlock_sdk.records, on the synthetic payloads of benchmark_codecs.py.
+# No login needed.
+
+import gc
+import sys
+import time
+import tracemalloc
+
+try:
+    from redlock_sdk import *
+except ImportError as e:
+    print("must install redlock sdk")
+    print("Error: {}".format(e))
+    exit(1)
+
+from benchmark_codecs import make_payloads
+
+
+import logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def policy_objects(items):
+    '''What RedLockPolicy.get() leaves behind for each policy'''
+    output = []
+    for policyData in items:
+        policy = standard.RedLockPolicy.__new__(standard.RedLockPolicy)
+        policy.api = None
+        policy.debug = False
+        policy.uuid = policyData['policyId']
+        policy.policyData = policyData
+        policy.__dict__.update(policy.policyData)
+        output.append(policy)
+    return(output)
+
+
+def account_objects(items):
+    '''What load_accounts() builds for each account'''
+    return([account.RedLockAWSAccount.from_data(None, a, detailed=False) for a in items])
+
+
+def measure(build, data, json_codec):
+    '''Bytes still allocated by build(decoded data) once the decode garbage is gone, and seconds taken'''
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = build(json_codec.loads(data))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return(size, elapsed)
+
+
+def main(args):
+    payloads = dict(make_payloads(args.alerts))
+    json_codec = codec.get_codec(args.codec)
+
+    cases = [
+        ("alerts", json_codec.dumps(payloads["v2/alert"]["items"]), [
+            ("dicts", lambda items: items),
+            ("records", records.RedLockAlertRecord.from_json_list),
+        ]),
+        ("accounts", json_codec.dumps(payloads["cloud listing"]), [
+            ("dicts", lambda items: items),
+            ("models", account_objects),
+            ("records", records.RedLockAccountRecord.from_json_list),
+        ]),
+        ("policies", json_codec.dumps(payloads["policy listing"]), [
+            ("dicts", lambda items: items),
+            ("models", policy_objects),
+            ("records", records.RedLockPolicyRecord.from_json_list),
+        ]),
+    ]
+
+    print(f"codec: {json_codec.name}\n")
+    print(f"{'payload':<10} {'representation':<16} {'MiB':>10} {'vs dicts':>9} {'build ms':>10}")
+    for name, data, builds in cases:
+        baseline = None
+        for label, build in builds:
+            size, elapsed = measure(build, data, json_codec)
+            baseline = baseline or size
+            print(f"{name:<10} {label:<16} {size / 2**20:>10.2f} {size / baseline:>8.0%} {elapsed * 1000:>10.1f}")
+
+
+def do_args():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alerts", help="Number of alerts to hold", type=int, default=20000)
+    parser.add_argument("--codec", help="JSON codec to decode with (default: fastest installed)", default=None)
+
+    args = parser.parse_args()
+    return(args)
+
+
+if __name__ == '__main__':
+    args = do_args()
+    main(args)
@@ -35,45 +35,31 @@ def main(args):
         exit(1)
 
 
-    # Dump Cloud Accounts
-    filename = "cloud_accounts.json"
-    data = rl_api.get("cloud")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
-    file.close()
-
-    # Dump Cloud Account groups
-    filename = "cloud_account_groups.json"
-    data = rl_api.get("cloud/group")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
-    file.close()
-
-    # Dump policies
-    filename = "policies.json"
-    data = rl_api.get("policy")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
-    file.close()
+    if args.format == "parquet":
+        # Accounts, groups, policies and alerts as columnar files, the rest as JSON below
+        from redlock_sdk import export
+        export.export_parquet(rl_api, args.path)
+    else:
+        dump_inventory(rl_api, args)
 
     # Dump policies
     filename = "policy_compliance_standards.json"
-    data = rl_api.get("policy/compliance")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
+    data = rl_api.get_json("policy/compliance")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
     file.close()
 
     filename = "standards.json"
-    data = rl_api.get("compliance")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
+    data = rl_api.get_json("compliance")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
     file.close()
 
 
     filename = "reports.json"
-    data = rl_api.get("report")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
+    data = rl_api.get_json("report")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
     file.close()
 
     # These next two require the standardId and RequirementId, so I can just dump them.
@@ -91,6 +77,36 @@ def main(args):
 
 
 
+    # Filtering Options. These have some pre-populated "suggestions" specific to your RedLock Tenant.
+    filename = "filters.json"
+    data = rl_api.get_json("filter/alert/suggest")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
+    file.close()
+
+def dump_inventory(rl_api, args):
+    '''Cloud accounts, groups, policies and alerts as JSON snapshots'''
+    # Dump Cloud Accounts
+    filename = "cloud_accounts.json"
+    data = rl_api.get_json("cloud")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
+    file.close()
+
+    # Dump Cloud Account groups
+    filename = "cloud_account_groups.json"
+    data = rl_api.get_json("cloud/group")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
+    file.close()
+
+    # Dump policies
+    filename = "policies.json"
+    data = rl_api.get_json("policy")
+    file = open(f"{args.path}/{filename}","wb")
+    rl_api.codec.write_snapshot(file, data)
+    file.close()
+
     # Get alerts. There can be a lot of these!
     filename = "alerts.json"
     querystring = {
@@ -98,17 +114,29 @@ def main(args):
             "timeUnit": "epoch",
             "detailed": False
             }
-    data = rl_api.get("v2/alert", params=querystring)
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
+    # Stream them to disk one at a time rather than holding the whole response in memory
+    response = rl_api.get_stream("v2/alert", params=querystring)
+    file = open(f"{args.path}/{filename}","w", encoding="utf-8")
+    with response:
+        write_alert_stream(file, stream.JSONArrayStream(response.iter_content(chunk_size=alerts.stream_chunk_size)), rl_api.codec)
     file.close()
 
-    # Filtering Options. These have some pre-populated "suggestions" specific to your RedLock Tenant.
-    filename = "filters.json"
-    data = rl_api.get("filter/alert/suggest")
-    file = open(f"{args.path}/{filename}","w")
-    file.write(json.dumps(data.json(), sort_keys=True, indent=2))
-    file.close()
+
+def write_alert_stream(file, alert_stream, json_codec):
+    '''Write a v2/alert response as it is parsed. Produces the same layout as json.dumps(sort_keys=True, indent=2)
+    as long as the response's other top level keys (totalRows, nextPageToken) sort after "items"'''
+    count = 0
+    file.write('{\n  "items": [')
+    for alert in alert_stream:
+        file.write(",\n    " if count else "\n    ")
+        file.write(json_codec.dumps_snapshot(alert).decode("utf-8").replace("\n", "\n    "))
+        count += 1
+    file.write("\n  ]" if count else "]")
+    for k in sorted(alert_stream.meta):
+        file.write(f",\n  {json.dumps(k)}: ")
+        file.write(json_codec.dumps_snapshot(alert_stream.meta[k]).decode("utf-8").replace("\n", "\n  "))
+    file.write("\n}")
+
 
 def do_args():
     import argparse
@@ -119,6 +147,8 @@ def do_args():
     parser.add_argument("--customer", help="RedLock Customer", required=True)
     parser.add_argument("--api_endpoint", help="RedLock API Endpoint to use", default="https://api2.redlock.io")
     parser.add_argument("--path", help="Dump Data to this path", default="json_dumps")
+    parser.add_argument("--format", help="Write accounts, groups, policies and alerts as json or parquet (needs pyarrow)",
+                        choices=["json", "parquet"], default="json")
 
 
     args = parser.parse_args()
@@ -32,6 +32,18 @@ def main(args):
         print("Login Failed")
         exit(1)
 
+    if args.account_group:
+        # Every account of the group, queried concurrently
+        group = account.RedLockAccountGroup(rl_api, args.account_group)
+        fan_out = group.account_alerts(policy_type=args.alert_type, status=args.alert_status)
+        alerts = {}
+        for cloud_account, alert in fan_out:
+            alerts.setdefault(cloud_account.account_id, []).append(alert)
+        for cloud_account, error in fan_out.errors.items():
+            logger.error(f"Failed to get alerts for {cloud_account.account_id}: {error}")
+        print(json.dumps(alerts, sort_keys=True, indent=2))
+        return
+
     cloud_account = account.RedLockAWSAccount(rl_api, args.account_id)
     alerts = cloud_account.get_alerts(policy_type=args.alert_type, status=args.alert_status)
     print(json.dumps(alerts, sort_keys=True, indent=2))
@@ -44,12 +56,15 @@ def do_args():
     parser.add_argument("--username", help="RedLock Username", required=True)
     parser.add_argument("--customer", help="RedLock Customer", required=True)
     parser.add_argument("--api_endpoint", help="RedLock API Endpoint to use", default="https://api2.redlock.io")
-    parser.add_argument("--account_id", help="Account ID", required=True)
+    parser.add_argument("--account_id", help="Account ID")
+    parser.add_argument("--account_group", help="List alerts for every account of this Account Group instead")
 
     parser.add_argument("--alert_type", help="Alert Type", default="config")
     parser.add_argument("--alert_status", help="Alert Status", default="open")
 
     args = parser.parse_args()
+    if not args.account_id and not args.account_group:
+        parser.error("one of --account_id or --account_group is required")
 
     # Logging idea stolen from: https://docs.python.org/3/howto/logging.html#configuring-logging
     # create console handler and set level to debug
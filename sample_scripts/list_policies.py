@@ -40,7 +40,7 @@ def main(args):
         filters.append(('cloud.type', args.cloud_type))
 
 
-    policies = rl_api.get("policy", params=filters).json()
+    policies = rl_api.get_json("policy", params=filters)
 
     if args.json:
         print(json.dumps(policies, sort_keys=True, indent=2))
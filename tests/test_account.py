@@ -0,0 +1,70 @@
+from redlock_sdk import account
+
+
+class FakeAPI(object):
+    '''Just enough of RedLockAPI for account groups: a cloud/group listing and recorded PUTs'''
+    identity_map = None
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.puts = []
+
+    def get_json(self, path, params=None):
+        assert path == "cloud/group"
+        return(self.groups)
+
+    def put(self, path, data=None):
+        self.puts.append((path, data))
+        return(FakeResponse())
+
+    def map_call(self, calls, max_workers=None):
+        return([call() for call in calls])
+
+
+class FakeResponse(object):
+    text = ""
+
+
+def group_data():
+    return({"id": "g1", "name": "G", "description": "", "accountIds": ["1"], "accounts": [{"id": "1", "type": "aws"}]})
+
+
+def test_sync_members_reads_a_generator_once():
+    api = FakeAPI([group_data()])
+    group = account.RedLockAccountGroup.from_data(api, group_data())
+    changes = group.sync_members((a for a in ["1", "9"]), refresh=False)
+    assert changes['added'] == ["9"]
+    assert api.puts == [("cloud/group/g1", {"accountIds": ["1", "9"], "description": "", "name": "G"})]
+
+
+def test_reconcile_groups_reads_a_generator_once():
+    api = FakeAPI([group_data()])
+    summary = account.reconcile_groups(api, {"G": (a for a in ["1", "9"])})
+    assert summary["G"]['added'] == ["9"]
+    assert api.puts[0][1]['accountIds'] == ["1", "9"]
+
+
+class FakeInventory(object):
+    identity_map = None
+
+    def __init__(self, entries):
+        self.api = self
+        self.entries = {e['accountId']: e for e in entries}
+
+    def get(self, kind, entity_id):
+        assert kind == "account"
+        return(self.entries.get(entity_id))
+
+
+def test_from_inventory_builds_the_class_of_the_cloud_type():
+    inventory = FakeInventory([{"accountId": "1", "name": "a", "cloudType": "azure"}])
+    cloud_account = account.RedLockCloudAccount.from_inventory(inventory, "1")
+    assert type(cloud_account) is account.RedLockAzureAccount
+    assert cloud_account.cloud_type == "azure"
+    assert type(account.RedLockAzureAccount.from_inventory(inventory, "1")) is account.RedLockAzureAccount
+    try:
+        account.RedLockAWSAccount.from_inventory(inventory, "1")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("an azure account was built as aws")
@@ -0,0 +1,39 @@
+from redlock_sdk import alert_store
+
+
+class FakeAPI(object):
+    '''v2/alert over a list of alerts: absolute windows filter on alertTime, alert.id filters by id'''
+
+    def __init__(self, alerts):
+        self.alerts = alerts
+        self.requests = []
+
+    def get_json(self, path, params=None):
+        self.requests.append(params)
+        items = self.alerts
+        if params['timeType'] == "absolute":
+            items = [a for a in items if params['startTime'] <= a['alertTime'] <= params['endTime']]
+        if 'alert.id' in params:
+            items = [a for a in items if a['id'] in params['alert.id']]
+        return({"items": items})
+
+    def map_call(self, calls, max_workers=None):
+        return([call() for call in calls])
+
+
+def test_old_alerts_resolved_since_the_last_sync_are_seen():
+    alerts = [{"id": "old", "status": "open", "alertTime": 1000, "lastUpdated": 1000},
+              {"id": "done", "status": "resolved", "alertTime": 1000, "lastUpdated": 1000}]
+    api = FakeAPI(alerts)
+    store = alert_store.RedLockAlertStore()
+    sync = alert_store.RedLockAlertSync(api, store)
+    sync.sync()
+    assert store.status_counts() == {"open": 1, "resolved": 1}
+
+    # Resolved long after it was raised: outside the next window
+    alerts[0] = dict(alerts[0], status="resolved", lastUpdated=2000)
+    summary = sync.sync()
+    assert summary['rechecked'] == 1
+    assert store.status_counts() == {"resolved": 2}
+    assert store.transitions("old") == [("old", "open", "resolved", 2000)]
+    assert api.requests[-1]['alert.id'] == ["old"]
@@ -0,0 +1,49 @@
+import threading
+
+from redlock_sdk import alerts
+
+
+class FakeSlicer(alerts.RedLockAlertTimeSlicer):
+    '''Windows are planned up front, window 1 fails, window 0 is slow'''
+
+    def __init__(self, windows, **kwargs):
+        super().__init__(None, start=0, end=100, max_workers=4, **kwargs)
+        self.windows = windows
+        self.release = threading.Event()
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def fetch_window(self, start, end):
+        with self.lock:
+            self.fetched.append(start)
+        if start == 0:
+            self.release.wait(5)
+        if start == 10:
+            raise RuntimeError("window failed")
+        return([{"id": f"{start}-{i}"} for i in range(3)] + [{"id": f"edge-{end}"}])
+
+
+def test_failures_are_recorded_before_the_iteration_ends():
+    slicer = FakeSlicer([(0, 9, 3), (10, 19, 3), (20, 29, 3)])
+    stream = iter(slicer)
+    slicer.release.set()
+    assert next(stream)['id'] == "0-0"
+    for i in range(3):
+        next(stream)
+    stream.close()
+    assert list(slicer.errors) == [1]
+
+
+def test_fetching_ahead_is_bounded():
+    windows = [(i * 10, i * 10 + 9, 3) for i in range(20)]
+    slicer = FakeSlicer(windows)
+    slicer.max_buffered_windows = 3
+    stream = iter(slicer)
+    thread = threading.Thread(target=lambda: next(stream))
+    thread.start()
+    thread.join(0.5)
+    assert sorted(slicer.fetched) == [0, 10, 20]
+    slicer.release.set()
+    thread.join(5)
+    rest = list(stream)
+    assert len(rest) == 18 * 4 + 3
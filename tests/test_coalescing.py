@@ -0,0 +1,40 @@
+import threading
+
+from redlock_sdk import redlock_api
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200, content=b"{}"):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+        self.text = content.decode()
+
+
+def test_get_after_a_write_does_not_join_an_older_get():
+    api = redlock_api.RedLockAPI("http://example.invalid")
+    api.header = {}
+    started = threading.Event()
+    release = threading.Event()
+    fetched = []
+
+    def fetch(path, params=None):
+        fetched.append(path)
+        if len(fetched) == 1:
+            started.set()
+            release.wait(5)
+            return("before write")
+        return("after write")
+    api.__fetch__ = fetch
+    api.try_wrapper = lambda method, path, **kwargs: FakeResponse()
+
+    results = []
+    old = threading.Thread(target=lambda: results.append(api.get("cloud/group")))
+    old.start()
+    started.wait(5)
+    api.put("cloud/group/g1", {"name": "G"})
+    assert api.get("cloud/group") == "after write"
+    release.set()
+    old.join(5)
+    assert results == ["before write"]
+    assert not api.inflight
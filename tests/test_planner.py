@@ -0,0 +1,30 @@
+from redlock_sdk import planner
+
+
+def section_query(section_id):
+    return({"timeType": "to_now", "timeUnit": "epoch", "detailed": False, "alert.status": "open",
+            "policy.complianceStandard": "CIS", "policy.complianceSection": section_id})
+
+
+def test_compliance_merges_ask_for_detailed_alerts():
+    queries = {s: section_query(s) for s in ["1.1", "1.2", "1.3"]}
+    planned = planner.RedLockAlertQueryPlanner(None, queries).plan()
+    assert len(planned) == 1
+    assert planned[0].filters['detailed'] is True
+    assert planned[0].filters['policy.complianceSection'] == ["1.1", "1.2", "1.3"]
+
+
+def test_account_merges_stay_summary():
+    queries = {a: {"detailed": False, "cloud.accountId": a} for a in ["1", "2"]}
+    planned = planner.RedLockAlertQueryPlanner(None, queries).plan()
+    assert planned[0].filters['detailed'] is False
+
+
+def test_none_filter_values_are_ignored():
+    assert planner.as_values(None) == ()
+    assert planner.as_values(["a", None]) == ("a",)
+    alert = {"status": "open", "resource": {"accountId": "1"}}
+    assert planner.matches(alert, {"cloud.accountId": "1", "policy.severity": None})
+    queries = {"a": {"cloud.accountId": "1", "cloud.region": None}, "b": {"cloud.accountId": "2"}}
+    planned = planner.RedLockAlertQueryPlanner(None, queries).plan()
+    assert len(planned) == 1
@@ -0,0 +1,26 @@
+import time
+
+from redlock_sdk import rate_limit
+
+
+def test_retry_after_on_an_unlimited_bucket_only_pauses():
+    limiter = rate_limit.RedLockRateLimiter()
+    limiter.acquire()
+    limiter.on_throttle(0.1)
+    assert limiter.rate is None
+    started = time.monotonic()
+    limiter.acquire()
+    limiter.acquire()
+    assert time.monotonic() - started < 0.5
+
+
+def test_first_throttle_seeds_from_the_sustained_rate():
+    limiter = rate_limit.RedLockRateLimiter()
+    limiter.acquire()
+    limiter.on_throttle()
+    assert limiter.rate == limiter.seed_min_rate
+    for i in range(200):
+        limiter.history.append(time.monotonic())
+    limiter.rate = None
+    limiter.on_throttle()
+    assert limiter.rate > limiter.seed_min_rate
@@ -0,0 +1,26 @@
+from redlock_sdk import records
+
+
+def round_trip(cls, data):
+    return(cls.from_json(data).to_json())
+
+
+def test_explicit_nulls_round_trip():
+    data = {"accountId": "1", "name": None, "cloudType": "aws"}
+    assert round_trip(records.RedLockAccountRecord, data) == data
+
+
+def test_nested_nulls_and_empty_objects_round_trip():
+    alerts = [
+        {"id": "a1", "status": "open", "policy": {}, "resource": {"accountId": "1", "region": None}},
+        {"id": "a2", "status": None, "policy": None, "resource": {"accountId": "1"}},
+        {"id": "a3", "policyId": None, "policy": {"policyId": "p1", "severity": "high"}},
+        {"id": "a4", "policy": {"policyId": "p1", "complianceMetadata": [{"standardName": "CIS", "sectionId": None}]}},
+    ]
+    for data in alerts:
+        assert round_trip(records.RedLockAlertRecord, data) == data
+
+
+def test_nested_policy_id_is_read():
+    record = records.RedLockAlertRecord.from_json({"id": "a1", "policy": {"policyId": "p1"}})
+    assert record.policyId == "p1"